@@ -0,0 +1,578 @@
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+import parser as car_parser
+import car_store
+import eda
+import schema
+import import_neo4j
+import graph_schema
+from snapshot import read_table
+from fetcher import AsyncFetcher
+from metrics import metrics
+
+def load_corpus(corpus_dir):
+    paths = sorted(glob.glob(os.path.join(corpus_dir, "**", "*.html"), recursive=True))
+    pages = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    return pages
+
+def measure(func, pages):
+    """Время на страницу (мс) и пик памяти на страницу (КБ) при разборе корпуса"""
+    start = time.perf_counter()
+    results = [func(html) for _, html in pages]
+    elapsed = time.perf_counter() - start
+
+    # Память меряем отдельным проходом: tracemalloc сильно замедляет разбор
+    peak = 0
+    for _, html in pages:
+        tracemalloc.start()
+        func(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return results, elapsed * 1000 / len(pages), peak / 1024
+
+# === Эталон: полный DOM, как до частичного разбора ===
+def extract_car_fields_full(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    fields = []
+    for selector in ["div.v", "div.params_table", "div.detail_auc__table.table.table_2"]:
+        element = soup.select_one(selector)
+        fields.append(element.get_text(strip=True) if element else "Не найдено")
+    return tuple(fields)
+
+def extract_listing_full(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    cards = soup.select("div.statistic_items_list")
+    if not cards:
+        return None
+    return [
+        {"title": a.get_text(strip=True), "url": f"{car_parser.SITE_URL}{a.get('href')}", "relative_url": a.get("href")}
+        for card in cards for a in card.select("a.name") if a.get("href")
+    ]
+
+# === Эталон: извлечение полей до однопроходного разбора ===
+def extract_field_value_legacy(text, field_name):
+    if not text or text == "Не найдено" or text == "Ошибка парсинга":
+        return "Не найдено"
+    
+    stop_fields = [
+        "Год", "Пробег", "КПП", "Цвет", "Привод", "Тип топлива", "Мощность", 
+        "Аукцион", "Номер лота", "Цена в Китае", "Объем", "Кузов тип", 
+        "Стандарты защиты окружающей среды", "Модель двигателя", "Смещение", "Количество передач", 
+        "Максимальная скорость", "Объем топливного бака", "Информация о номерном знаке"
+    ]
+    
+    field_pattern = rf"{re.escape(field_name)}\s*:?\s*([^\n\r]+)"
+    match = re.search(field_pattern, text, re.IGNORECASE | re.MULTILINE)
+    
+    if not match:
+        return "Не найдено"
+    
+    found_line = match.group(1).strip()
+    found_line = re.sub(r'^[::\s]+', '', found_line)
+    
+    for stop_field in stop_fields:
+        if stop_field != field_name:
+            stop_pattern = rf"({re.escape(stop_field)})"
+            stop_match = re.search(stop_pattern, found_line, re.IGNORECASE)
+            if stop_match:
+                found_line = found_line[:stop_match.start()].strip()
+                break
+    
+    if field_name == "Цвет":
+        color_match = re.match(r"(\w+)", found_line)
+        if color_match:
+            return color_match.group(1)
+    
+    elif field_name == "Год":
+        year_match = re.search(r"(\d{4})", found_line)
+        if year_match:
+            return year_match.group(1)
+    
+    elif field_name == "Пробег":
+        mileage_match = re.search(r"(\d+\s*км)", found_line)
+        if mileage_match:
+            return mileage_match.group(1)
+    
+    elif field_name == "КПП":
+        if "AT" in found_line.upper():
+            return "AT"
+        elif "MT" in found_line.upper() or "МТ" in found_line.upper():
+            return "MT"
+        elif "CVT" in found_line.upper():
+            return "CVT"
+    
+    elif field_name == "Привод":
+        if "Передний" in found_line or "FWD" in found_line.upper():
+            return "FWD"
+        elif "Задний" in found_line or "RWD" in found_line.upper():
+            return "RWD"
+        elif "Полный" in found_line or "4WD" in found_line.upper() or "AWD" in found_line.upper():
+            return "AWD"
+    
+    elif field_name == "Тип топлива":
+        if "Бензин" in found_line:
+            return "Бензин"
+        elif "Дизел" in found_line or "Дизель" in found_line:
+            return "Дизель"
+        elif "Электр" in found_line:
+            return "Электричество"
+        elif "Гибрид" in found_line:
+            return "Гибрид"
+    
+    elif field_name == "Мощность":
+        power_match = re.search(r"(\d+\s*л\.с\.)", found_line)
+        if power_match:
+            return power_match.group(1)
+    
+    elif field_name == "Объем":
+        volume_match = re.search(r"(\d+\s*см3|\d+[\.,]\d*\s*L)", found_line)
+        if volume_match:
+            return volume_match.group(1)
+    
+    elif field_name == "Цена в Китае":
+        price_match = re.search(r"(\d+[\s\d,]*\s*¥)", found_line)
+        if price_match:
+            return price_match.group(1)
+    
+    elif field_name == "Аукцион":
+        auction_parts = found_line.split("Номер лота")
+        if auction_parts:
+            result = auction_parts[0].strip()
+            result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+            return result if result else "Не найдено"
+    
+    elif field_name == "Стандарты защиты окружающей среды":
+        euro_match = re.search(r"(Euro\s*[IVX\d\s]+)", found_line, re.IGNORECASE)
+        if euro_match:
+            euro_standard = euro_match.group(1).strip()
+            euro_standard = re.sub(r'\s+', ' ', euro_standard)
+            return euro_standard
+        return "Не найдено"
+    
+    elif field_name == "Количество передач":
+        gear_match = re.search(r"(\d+)", found_line)
+        if gear_match:
+            return gear_match.group(1)
+        return "Не найдено"
+    
+    elif field_name == "Кузов тип":
+        body_patterns = [
+            r"седан", r"хэтчбек", r"универсал", r"внедорожник", r"кроссовер", 
+            r"купе", r"кабриолет", r"минивэн", r"пикап", r"лифтбек", r"mpv"
+        ]
+        for pattern in body_patterns:
+            body_match = re.search(pattern, found_line, re.IGNORECASE)
+            if body_match:
+                return body_match.group(0).lower()
+        
+        if "автомобиль" in found_line.lower():
+            return "седан"
+        
+        if "информация о номерном знаке" in found_line.lower():
+            return "Не найдено"
+    
+    elif field_name == "Модель двигателя":
+        displacement_match = re.search(r"(.+?)(?:Смещение|$)", found_line, re.IGNORECASE)
+        if displacement_match:
+            result = displacement_match.group(1).strip()
+            result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+            result = result.replace(',', ' ')
+            return result if result and result != '-' else "Не найдено"
+        else:
+            result = re.sub(r'^[::\s]+|[::\s]+$', '', found_line)
+            result = result.replace(',', ' ')
+            return result if result and result != '-' else "Не найдено"
+
+    result = found_line[:50] if len(found_line) > 50 else found_line
+    result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+    return result if result else "Не найдено"
+
+def parse_car_info_legacy(brief_info, detailed_specs):
+    info = {}
+    for key, field_name in car_parser.BRIEF_FIELDS.items():
+        info[key] = extract_field_value_legacy(brief_info, field_name)
+    for key, field_name in car_parser.SPECS_FIELDS.items():
+        info[key] = extract_field_value_legacy(detailed_specs, field_name)
+    return info
+
+def bench_extract(args):
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print(f"В {args.corpus} нет .html файлов")
+        return
+
+    texts = [car_parser.extract_car_fields(html)[1:] for _, html in pages]
+    records = (texts * (args.records // len(texts) + 1))[:args.records]
+
+    timings = {}
+    outputs = {}
+    for name, func in [("Старый extract_field_value", parse_car_info_legacy), ("Однопроходный", car_parser.parse_car_info)]:
+        start = time.perf_counter()
+        outputs[name] = [func(brief_info, detailed_specs) for brief_info, detailed_specs in records]
+        timings[name] = (time.perf_counter() - start) * 1_000_000 / len(records)
+        print(f"{name:28} {timings[name]:8.1f} мкс/машину")
+
+    old_out, new_out = outputs.values()
+    old_time, new_time = timings.values()
+    mismatches = sum(1 for old, new in zip(old_out, new_out) if old != new)
+    print(f"Записей: {len(records)} (уникальных страниц: {len(texts)}), ускорение: x{old_time / new_time:.2f}")
+    if mismatches:
+        print(f"❌ Расхождения в {mismatches} записях")
+    else:
+        print("✅ Результат parse_car_info совпадает")
+
+def bench_parse(args):
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print(f"В {args.corpus} нет .html файлов")
+        return
+
+    if args.listing:
+        baseline, fast = extract_listing_full, car_parser.parse_listing_html
+    else:
+        baseline, fast = extract_car_fields_full, car_parser.extract_car_fields
+
+    old_results, old_time, old_mem = measure(baseline, pages)
+    new_results, new_time, new_mem = measure(fast, pages)
+
+    mismatches = [path for (path, _), old, new in zip(pages, old_results, new_results) if old != new]
+    print(f"Страниц: {len(pages)}, парсер: {car_parser.HTML_PARSER}")
+    print(f"Полный DOM:    {old_time:8.2f} мс/стр, пик памяти {old_mem:10.1f} КБ")
+    print(f"Частичный DOM: {new_time:8.2f} мс/стр, пик памяти {new_mem:10.1f} КБ")
+    print(f"Ускорение: x{old_time / new_time:.2f}")
+    if mismatches:
+        print(f"❌ Расхождения в {len(mismatches)} страницах:")
+        for path in mismatches[:20]:
+            print(f"  {path}")
+    else:
+        print("✅ Вывод совпадает на всём корпусе")
+
+# === Эталон: построчная очистка eda.py до векторизации ===
+def clean_cars_legacy(df):
+    df = df.copy()
+    df.drop(df[df['price_rub'] == 'Цену уточняйте'].index, inplace=True)
+    df.drop(df[(df['power'] == 'Не найдено') & (df['engine'] == 'Не найдено')].index, inplace=True)
+    df.drop(df[(df['fuel_type'] == 'Не найдено') & (df['engine'] == 'Не найдено')].index, inplace=True)
+    if 'gear_count' in df.columns:
+        df.drop(columns=['gear_count'], inplace=True)
+
+    df['title'] = df['title'].apply(eda.clean_title_simple)
+    df['environmental_standards'] = df['environmental_standards'].apply(lambda x: x.replace('Не найдено', 'Euro v I').lower())
+    df['transmission'] = df['transmission'].apply(lambda x: x.replace('МТ', 'MT').replace('АТ', 'AT'))
+    df['price_rub'] = df['price_rub'].apply(eda.price_to_int)
+    df['fuel_type'] = df['fuel_type'].replace('Не найдено', 'Бензин')
+    df['power'] = df['power'].apply(eda.extract_power)
+    mean_power = df['power'].mean()
+    mean_power = 150 if pd.isna(mean_power) else int(mean_power)
+    df['power'] = df['power'].fillna(mean_power).astype(int)
+    df['mileage'] = df['mileage'].str.replace('км', '', regex=False).str.replace(' ', '', regex=False).astype(int)
+    df['engine_volume'] = df['engine_volume'] \
+        .str.replace('см3', '', regex=False) \
+        .str.replace('cм3', '', regex=False) \
+        .str.replace(' ', '', regex=False) \
+        .astype(int)
+    df['china_price'] = df['china_price'].str.replace('¥', '', regex=False).str.replace(' ', '', regex=False).astype(int)
+    for column in ['engine', 'drive_type', 'body_type']:
+        mode = df.loc[df[column] != 'Не найдено', column].mode()
+        df[column] = df[column].replace('Не найдено', mode.iloc[0] if len(mode) > 0 else 'Unknown')
+    return df
+
+def synthetic_cars(rows, seed=0):
+    """Сырые строки в формате cars.csv, включая "Не найдено" и "Цену уточняйте" """
+    rng = np.random.default_rng(seed)
+
+    def pick(values, missing=0.0):
+        column = rng.choice(np.array(values, dtype=object), rows)
+        if missing:
+            column[rng.random(rows) < missing] = 'Не найдено'
+        return column
+
+    prices = np.char.add(rng.integers(500_000, 9_000_000, rows).astype(str), ' ₽').astype(object)
+    prices[rng.random(rows) < 0.03] = 'Цену уточняйте'
+    powers = np.char.add(rng.integers(70, 500, rows).astype(str), ' л.с.').astype(object)
+    powers[rng.random(rows) < 0.05] = 'Не найдено'
+    return pd.read_csv(io.StringIO(pd.DataFrame({
+        'title': pick(['Toyota Camry Import', 'BMW X5  other', 'Geely  Monjaro', 'Li Auto L7\xa0Pro', 'Zeekr 001 IMPORT']),
+        'url': [f'https://mado.group/car/{i}/' for i in range(rows)],
+        'price_rub': prices,
+        'year': rng.integers(2012, 2025, rows),
+        'mileage': np.char.add(rng.integers(0, 200_000, rows).astype(str), ' км'),
+        'transmission': pick(['АТ', 'МТ', 'AT', 'Робот']),
+        'color': pick(['Белый', 'Черный', 'Серый'], 0.02),
+        'drive_type': pick(['Передний', 'Полный', 'Задний'], 0.05),
+        'fuel_type': pick(['Бензин', 'Гибрид', 'Электро'], 0.05),
+        'power': powers,
+        'auction': pick(['Пекин', 'Шанхай']),
+        'china_price': np.char.add(rng.integers(50_000, 900_000, rows).astype(str), ' ¥'),
+        'engine_volume': np.char.add(rng.integers(900, 5000, rows).astype(str), pick([' см3', ' cм3'])),
+        'body_type': pick(['Седан', 'Кроссовер', 'Хэтчбек'], 0.05),
+        'environmental_standards': pick(['Euro VI', 'Euro V', 'Китай VI'], 0.1),
+        'engine': pick(['M20A', 'B48', 'JLH-4G20TDB'], 0.05),
+        'gear_count': pick(['6', '8', 'Не найдено']),
+    }).to_csv(index=False)))
+
+def bench_eda(args):
+    for rows in args.rows:
+        df = synthetic_cars(rows)
+        timings = {}
+        outputs = {}
+        for name, func in [("Построчная", clean_cars_legacy), ("Векторная", eda.clean_cars)]:
+            start = time.perf_counter()
+            cleaned = func(df)
+            timings[name] = time.perf_counter() - start
+            outputs[name] = cleaned.to_csv(index=False)
+        old_time, new_time = timings.values()
+        same = "✅ совпадает" if len(set(outputs.values())) == 1 else "❌ расходится"
+        print(f"{rows:>9} строк: построчно {old_time:8.3f} с, векторно {new_time:8.3f} с, "
+              f"ускорение x{old_time / new_time:.2f}, вывод {same}")
+
+def bench_schema(args):
+    """Память очищенных данных: типы по умолчанию против схемы schema.py"""
+    # CSV без схемы — так данные выглядели в памяти раньше
+    raw = pd.read_csv(args.path) if args.path.endswith(".csv") else read_table(args.path)
+    start = time.perf_counter()
+    typed = schema.apply_schema(raw)
+    elapsed = time.perf_counter() - start
+    print(f"Строк: {len(raw)}, приведение типов {elapsed:.3f} с")
+    before = raw.memory_usage(deep=True, index=False)
+    after = typed.memory_usage(deep=True, index=False)
+    for column in raw.columns:
+        print(f"{column:24} {str(raw[column].dtype):>10} {before[column] / 1024 / 1024:9.2f} МБ"
+              f" → {str(typed[column].dtype):>10} {after[column] / 1024 / 1024:9.2f} МБ")
+    schema.report_memory(raw, typed, "Всего")
+
+# Запросы telegram_bot.py, которые выполняются на каждом шаге диалога
+GRAPH_QUERIES = {
+    "годы модели": """
+        MATCH (c:Car)-[:HAS_YEAR]->(y:Year)
+        WHERE c.title = $title
+        RETURN DISTINCT y.value AS year
+    """,
+    "трансмиссии": """
+        MATCH (c:Car)-[:HAS_YEAR]->(:Year {value: $year}),
+              (c)-[:HAS_TRANSMISSION]->(t:Transmission)
+        WHERE c.title = $title
+        RETURN DISTINCT t.type AS transmission
+    """,
+    "приводы": """
+        MATCH (c:Car)-[:HAS_YEAR]->(:Year {value: $year}),
+              (c)-[:HAS_TRANSMISSION]->(:Transmission {type: $transmission}),
+              (c)-[:HAS_DRIVE]->(d:Drive)
+        WHERE c.title = $title
+        RETURN DISTINCT d.type AS drive
+    """,
+    "машина по url": """
+        MATCH (c:Car {url: $url})-[:HAS_CHINA_PRICE]->(cp:ChinaPrice)
+        RETURN cp.value AS china_price
+    """,
+}
+
+def wipe_graph(driver):
+    with driver.session() as session:
+        session.run("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS").consume()
+
+def time_queries(driver, params, repeat):
+    timings = {}
+    with driver.session() as session:
+        for name, query in GRAPH_QUERIES.items():
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                session.run(query, params).consume()
+                runs.append(time.perf_counter() - start)
+            timings[name] = sorted(runs)[len(runs) // 2]
+    return timings
+
+def bench_graph(args):
+    """Импорт и запросы бота на тестовой базе Neo4j: без индексов и с graph_schema.py"""
+    if not args.wipe:
+        print("❌ Бенчмарк удаляет все узлы в базе NEO4J_URI. Запустите с --wipe на тестовой базе")
+        return
+    df = schema.apply_schema(eda.clean_cars(synthetic_cars(args.rows)))
+    sample = df.iloc[0]
+    params = {
+        "title": str(sample["title"]).lower(),
+        "year": int(sample["year"]),
+        "transmission": str(sample["transmission"]),
+        "url": str(sample["url"]),
+    }
+    driver = import_neo4j.create_driver()
+    results = {}
+    try:
+        for name, prepare in [("Без индексов", graph_schema.drop_graph_schema),
+                              ("С индексами", graph_schema.ensure_graph_schema)]:
+            wipe_graph(driver)
+            prepare(driver)
+            start = time.perf_counter()
+            import_neo4j.import_cars(df, driver, args.batch_size)
+            import_time = time.perf_counter() - start
+            results[name] = {"импорт": import_time, **time_queries(driver, params, args.repeat)}
+        wipe_graph(driver)
+    finally:
+        driver.close()
+
+    print(f"{'':16}" + "".join(f"{name:>16}" for name in results))
+    for metric in next(iter(results.values())):
+        before, after = (result[metric] for result in results.values())
+        print(f"{metric:16}{before * 1000:13.1f} мс{after * 1000:13.1f} мс  x{before / max(after, 1e-9):.1f}")
+
+def bench_ingest(args):
+    """Пропускная способность двухфазного импорта в зависимости от числа воркеров"""
+    if not args.wipe:
+        print("❌ Бенчмарк удаляет все узлы в базе NEO4J_URI. Запустите с --wipe на тестовой базе")
+        return
+    df = schema.apply_schema(eda.clean_cars(synthetic_cars(args.rows)))
+    driver = import_neo4j.create_driver()
+    results = []
+    try:
+        graph_schema.ensure_graph_schema(driver)
+        for workers in args.workers:
+            wipe_graph(driver)
+            start = time.perf_counter()
+            import_neo4j.import_cars(df, driver, args.batch_size, workers)
+            results.append((workers, time.perf_counter() - start))
+        wipe_graph(driver)
+    finally:
+        driver.close()
+
+    base_time = results[0][1]
+    for workers, elapsed in results:
+        print(f"{workers:>3} воркеров: {elapsed:8.2f} с, {len(df) / elapsed:8.0f} машин/с, x{base_time / elapsed:.2f}")
+
+# Конфигурации для сравнения движков на одном и том же корпусе
+CRAWL_MATRIX = [
+    {"PARSE_EXECUTOR": "thread", "LISTING_PREFETCH": "1"},
+    {"PARSE_EXECUTOR": "thread", "LISTING_PREFETCH": "3"},
+    {"PARSE_EXECUTOR": "process", "LISTING_PREFETCH": "1"},
+    {"PARSE_EXECUTOR": "process", "LISTING_PREFETCH": "3"},
+]
+
+def peak_rss_mb():
+    # На Linux ru_maxrss в КБ; пул процессов разбора учитывается через RUSAGE_CHILDREN
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024
+
+def run_crawl(site, concurrency, max_pages):
+    """Полный парсинг и проверка новых объявлений во временном каталоге"""
+    car_parser.SITE_URL = site.rstrip("/")
+    workdir = tempfile.mkdtemp(prefix="crawl_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        metrics.reset()
+        with AsyncFetcher(concurrency) as fetcher:
+            start = time.perf_counter()
+            car_parser.parse_all_pages(fetcher, max_pages=max_pages)
+            crawl_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            car_parser.check_for_new_cars(fetcher)
+            check_time = time.perf_counter() - start
+        car_parser.shutdown_parse_executor()
+        counters = metrics.snapshot()["counters"]
+        return {
+            "parse_executor": car_parser.PARSE_EXECUTOR,
+            "listing_prefetch": car_parser.LISTING_PREFETCH,
+            "concurrency": concurrency,
+            "cars": car_store.total_rows(),
+            "crawl_sec": round(crawl_time, 3),
+            "cars_per_sec": round(car_store.total_rows() / crawl_time, 2),
+            "check_sec": round(check_time, 3),
+            "requests": counters["requests"],
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_crawl(args):
+    if not args.compare:
+        result = run_crawl(args.site, args.concurrency, args.max_pages)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            for key, value in result.items():
+                print(f"{key:18} {value}")
+        return
+
+    # Каждая конфигурация в отдельном процессе: настройки читаются при импорте, а пик RSS не копится
+    results = []
+    for config in CRAWL_MATRIX:
+        command = [sys.executable, os.path.abspath(__file__), "crawl", args.site, "--json", "--concurrency", str(args.concurrency)]
+        if args.max_pages:
+            command += ["--max-pages", str(args.max_pages)]
+        output = subprocess.run(command, env={**os.environ, **config}, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = ["parse_executor", "listing_prefetch", "cars", "crawl_sec", "cars_per_sec", "check_sec", "peak_rss_mb"]
+    print(" | ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{str(result[column]):>16}" for column in columns))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарки парсера")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    parse_cmd = commands.add_parser("parse", help="разбор сохранённых страниц: полный и частичный DOM")
+    parse_cmd.add_argument("corpus", help="каталог с сохранёнными .html страницами")
+    parse_cmd.add_argument("--listing", action="store_true", help="корпус из страниц списка, а не страниц машин")
+    parse_cmd.set_defaults(func=bench_parse)
+
+    extract_cmd = commands.add_parser("extract", help="извлечение полей: старый extract_field_value и однопроходный")
+    extract_cmd.add_argument("corpus", help="каталог с сохранёнными .html страницами машин")
+    extract_cmd.add_argument("--records", type=int, default=5000, help="сколько записей прогнать (страницы повторяются)")
+    extract_cmd.set_defaults(func=bench_extract)
+
+    crawl_cmd = commands.add_parser("crawl", help="полный парсинг против replay_server.py: время, пропускная способность, пик RSS")
+    crawl_cmd.add_argument("site", help="адрес replay_server.py, например http://127.0.0.1:8080")
+    crawl_cmd.add_argument("--concurrency", type=int, default=24)
+    crawl_cmd.add_argument("--max-pages", type=int, default=None)
+    crawl_cmd.add_argument("--compare", action="store_true", help="прогнать матрицу движков разбора и опережения")
+    crawl_cmd.add_argument("--json", action="store_true", help="вывести результат одной строкой JSON")
+    crawl_cmd.set_defaults(func=bench_crawl)
+
+    eda_cmd = commands.add_parser("eda", help="очистка eda.py на синтетических данных: построчная и векторная")
+    eda_cmd.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    eda_cmd.set_defaults(func=bench_eda)
+
+    schema_cmd = commands.add_parser("schema", help="память очищенных данных до и после schema.py")
+    schema_cmd.add_argument("path", help="clean_cars.csv или снимок .parquet")
+    schema_cmd.set_defaults(func=bench_schema)
+
+    graph_cmd = commands.add_parser("graph", help="импорт и запросы бота в Neo4j без индексов и с graph_schema.py")
+    graph_cmd.add_argument("--rows", type=int, default=20_000, help="сколько синтетических машин импортировать")
+    graph_cmd.add_argument("--batch-size", type=int, default=import_neo4j.IMPORT_BATCH_SIZE)
+    graph_cmd.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса (берётся медиана)")
+    graph_cmd.add_argument("--wipe", action="store_true", help="подтверждение: база NEO4J_URI будет очищена")
+    graph_cmd.set_defaults(func=bench_graph)
+
+    ingest_cmd = commands.add_parser("ingest", help="двухфазный импорт в Neo4j при разном числе воркеров")
+    ingest_cmd.add_argument("--rows", type=int, default=50_000, help="сколько синтетических машин импортировать")
+    ingest_cmd.add_argument("--batch-size", type=int, default=import_neo4j.IMPORT_BATCH_SIZE)
+    ingest_cmd.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ingest_cmd.add_argument("--wipe", action="store_true", help="подтверждение: база NEO4J_URI будет очищена")
+    ingest_cmd.set_defaults(func=bench_ingest)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import hashlib
+import os
+import time
+import numpy as np
+import pandas as pd
+from snapshot import read_table
+from schema import apply_schema
+from import_neo4j import DIMENSIONS, PARAM_COLUMNS, car_frame
+
+# Файлы для офлайн-загрузки neo4j-admin database import full: база собирается
+# из CSV при остановленном Neo4j, без транзакций и MERGE
+BULK_DIR = os.getenv("BULK_IMPORT_DIR", "bulk_import")
+# Где эти файлы видит контейнер neo4j (том neo4j_import в docker-compose.yml)
+NEO4J_IMPORT_DIR = os.getenv("NEO4J_IMPORT_DIR", "/var/lib/neo4j/import")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+# Типы свойств в заголовках: те же, что у параметров запросов импорта (PARAM_COLUMNS)
+NEO4J_TYPES = {"int64": "long", float: "double", str: "string"}
+
+def stable_ids(label, keys: pd.DataFrame):
+    """Идентификатор каждой строки: хеш метки и ключа MERGE, одинаковый при любой пересборке"""
+    codes = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+    distinct = keys.drop_duplicates().astype(str)
+    ids = np.array([
+        hashlib.sha1("\x1f".join([label, *values]).encode("utf-8")).hexdigest()[:16]
+        for values in distinct.itertuples(index=False)
+    ], dtype=object)
+    # ngroup(sort=False) нумерует группы в порядке первого появления, как drop_duplicates
+    return ids[codes]
+
+def header(name, param):
+    return f"{name}:{NEO4J_TYPES[PARAM_COLUMNS[param][1]]}"
+
+def write_nodes(path, label, ids, nodes: pd.DataFrame):
+    nodes = nodes.copy()
+    nodes.insert(0, f":ID({label})", ids)
+    nodes = nodes.drop_duplicates(subset=f":ID({label})")
+    nodes.to_csv(path, index=False)
+    return len(nodes)
+
+def write_relationships(path, label, car_ids, end_ids):
+    relationships = pd.DataFrame({":START_ID(Car)": car_ids, f":END_ID({label})": end_ids})
+    # MERGE не создаёт вторую такую же связь
+    relationships = relationships.drop_duplicates()
+    relationships.to_csv(path, index=False)
+    return len(relationships)
+
+def build_bulk_files(input_file, output_dir=BULK_DIR):
+    """CSV узлов и связей для neo4j-admin с тем же графом, что строит import_cars (DIMENSIONS)"""
+    start = time.perf_counter()
+    df = apply_schema(read_table(input_file))
+    missing_price = df["price_rub"].isna()
+    if missing_price.any():
+        print(f"⚠️ Пропущено {int(missing_price.sum())} машин без цены")
+        df = df.loc[~missing_price]
+    frame = car_frame(df)
+    del df
+    os.makedirs(output_dir, exist_ok=True)
+
+    nodes, relationships = {}, {}
+    # Car: MERGE по {title: toLower(title), url}
+    cars = pd.DataFrame({"title": frame["title"].str.lower(), "url": frame["url"]})
+    car_ids = stable_ids("Car", cars)
+    nodes["Car"] = "nodes_Car.csv"
+    count = write_nodes(os.path.join(output_dir, nodes["Car"]), "Car", car_ids, cars)
+    print(f"🚗 Car: {count} узлов")
+
+    for _, label, properties, relationship in DIMENSIONS:
+        keys = frame[list(properties.values())]
+        ids = stable_ids(label, keys)
+        values = keys.set_axis([header(name, param) for name, param in properties.items()], axis=1)
+        nodes[label] = f"nodes_{label}.csv"
+        node_count = write_nodes(os.path.join(output_dir, nodes[label]), label, ids, values)
+        relationships[relationship] = f"rels_{relationship}.csv"
+        relationship_count = write_relationships(
+            os.path.join(output_dir, relationships[relationship]), label, car_ids, ids
+        )
+        print(f"🧩 {label}: {node_count} узлов, {relationship}: {relationship_count} связей")
+
+    print(f"✅ Файлы для загрузки записаны в {output_dir} за {time.perf_counter() - start:.2f} с")
+    return nodes, relationships
+
+def admin_command(nodes, relationships, import_dir=NEO4J_IMPORT_DIR, database=NEO4J_DATABASE):
+    """Команда neo4j-admin (Neo4j 5), которая пересоздаёт базу из записанных файлов"""
+    arguments = [f"neo4j-admin database import full {database} --overwrite-destination"]
+    arguments += [f"--nodes={label}={import_dir}/{file}" for label, file in nodes.items()]
+    arguments += [f"--relationships={kind}={import_dir}/{file}" for kind, file in relationships.items()]
+    return " \\\n    ".join(arguments)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="CSV для офлайн-загрузки очищенных машин через neo4j-admin")
+    arg_parser.add_argument("filename", nargs="?", default="clean_cars.parquet", help="очищенные данные: снимок .parquet или CSV")
+    arg_parser.add_argument("--output", default=BULK_DIR, help="каталог для CSV узлов и связей")
+    arg_parser.add_argument("--import-dir", default=NEO4J_IMPORT_DIR, help="каталог, где файлы видит neo4j-admin")
+    arg_parser.add_argument("--database", default=NEO4J_DATABASE)
+    args = arg_parser.parse_args()
+
+    nodes, relationships = build_bulk_files(args.filename, args.output)
+    print(f"\n📋 Скопируйте {args.output}/* в {args.import_dir}, остановите Neo4j и выполните:\n")
+    print(admin_command(nodes, relationships, args.import_dir, args.database))
+    # Ограничения и индексы neo4j-admin не создаёт: их добавит graph_schema при первом подключении
+    print("\nПосле запуска Neo4j индексы создаст ensure_graph_schema при старте импортёра или бота.")
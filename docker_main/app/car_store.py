@@ -0,0 +1,244 @@
+import csv
+import json
+import os
+import time
+
+# Хранилище машин: каталог с CSV-сегментами и манифестом.
+# Манифест перечисляет сегменты в порядке "сначала новые" и хранит число строк
+# и размер каждого сегмента. Новые объявления дописываются в головной сегмент,
+# строки полного парсинга (более старые) — в хвостовой. Физически файлы
+# только дописываются, а порядок "сначала новые" восстанавливает читатель.
+STORE_DIR = "cars_store"
+MANIFEST_FILE = "manifest.json"
+SEGMENT_MAX_ROWS = int(os.getenv("STORE_SEGMENT_MAX_ROWS", "20000"))
+# Пакетная запись полного парсинга: сброс на диск по числу строк или по времени
+FLUSH_ROWS = int(os.getenv("STORE_FLUSH_ROWS", "500"))
+FLUSH_SECONDS = float(os.getenv("STORE_FLUSH_SECONDS", "30"))
+
+# Направление сегмента: "tail" — порядок в файле совпадает с порядком чтения,
+# "head" — строки в файле лежат от старых к новым и читаются в обратном порядке
+HEAD = "head"
+TAIL = "tail"
+
+def manifest_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, MANIFEST_FILE)
+
+def exists(store_dir=STORE_DIR):
+    return os.path.exists(manifest_path(store_dir))
+
+def load_manifest(store_dir=STORE_DIR):
+    if not exists(store_dir):
+        return {"fieldnames": [], "segments": [], "total_rows": 0, "next_segment_id": 1}
+    with open(manifest_path(store_dir), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, store_dir=STORE_DIR):
+    """Атомарная запись манифеста: строки считаются записанными только после неё"""
+    os.makedirs(store_dir, exist_ok=True)
+    manifest["total_rows"] = sum(segment["rows"] for segment in manifest["segments"])
+    manifest["newest_segment"] = manifest["segments"][0]["file"] if manifest["segments"] else None
+    tmp_path = manifest_path(store_dir) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(store_dir))
+
+def total_rows(store_dir=STORE_DIR):
+    return load_manifest(store_dir)["total_rows"]
+
+def newest_segment(store_dir=STORE_DIR):
+    return load_manifest(store_dir).get("newest_segment")
+
+def _new_segment(manifest, direction, store_dir):
+    name = f"segment_{manifest['next_segment_id']:06d}_{direction}.csv"
+    manifest["next_segment_id"] += 1
+    with open(os.path.join(store_dir, name), "w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=manifest["fieldnames"]).writeheader()
+    return {"file": name, "direction": direction, "rows": 0, "bytes": os.path.getsize(os.path.join(store_dir, name))}
+
+def _append_to_segment(segment, fieldnames, rows, store_dir):
+    path = os.path.join(store_dir, segment["file"])
+    # Отбрасываем хвост, не попавший в манифест (например, после падения)
+    with open(path, "r+b") as f:
+        f.truncate(segment["bytes"])
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    segment["bytes"] = os.path.getsize(path)
+    segment["rows"] += len(rows)
+
+def _write_rows(fieldnames, rows, direction, store_dir):
+    manifest = load_manifest(store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    if not manifest["fieldnames"]:
+        manifest["fieldnames"] = list(fieldnames)
+    fieldnames = manifest["fieldnames"]
+
+    segments = manifest["segments"]
+    edge = 0 if direction == HEAD else -1
+    if not segments or segments[edge]["direction"] != direction or segments[edge]["rows"] >= SEGMENT_MAX_ROWS:
+        segment = _new_segment(manifest, direction, store_dir)
+        if direction == HEAD:
+            segments.insert(0, segment)
+        else:
+            segments.append(segment)
+    segment = segments[edge]
+
+    # В головном сегменте самые новые строки должны оказаться в конце файла
+    _append_to_segment(segment, fieldnames, list(reversed(rows)) if direction == HEAD else rows, store_dir)
+    save_manifest(manifest, store_dir)
+
+def prepend_rows(fieldnames, rows, store_dir=STORE_DIR):
+    """Добавляет новые машины перед всеми существующими за O(размер пачки)"""
+    if rows:
+        _write_rows(fieldnames, rows, HEAD, store_dir)
+
+def append_rows(fieldnames, rows, store_dir=STORE_DIR):
+    """Добавляет машины после всех существующих (полный парсинг идёт от новых к старым)"""
+    if rows:
+        _write_rows(fieldnames, rows, TAIL, store_dir)
+
+class TailWriter:
+    """Пакетная запись в хвост хранилища на время полного парсинга.
+
+    Файл сегмента остаётся открытым, страницы копятся в буфере и сбрасываются
+    целиком, когда набирается flush_rows строк или проходит flush_seconds.
+    Сброс завершается записью манифеста, поэтому страница либо записана
+    полностью, либо не записана вовсе.
+    """
+
+    def __init__(self, fieldnames, store_dir=STORE_DIR, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.store_dir = store_dir
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        os.makedirs(store_dir, exist_ok=True)
+        self.manifest = load_manifest(store_dir)
+        if not self.manifest["fieldnames"]:
+            self.manifest["fieldnames"] = list(fieldnames)
+        self._file = None
+        self._writer = None
+        self._segment = None
+        self._pending_pages = []
+        self._pending_rows = 0
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open_segment(self):
+        segments = self.manifest["segments"]
+        if not segments or segments[-1]["direction"] != TAIL or segments[-1]["rows"] >= SEGMENT_MAX_ROWS:
+            segments.append(_new_segment(self.manifest, TAIL, self.store_dir))
+        self._segment = segments[-1]
+        path = os.path.join(self.store_dir, self._segment["file"])
+        # Отбрасываем хвост, не попавший в манифест (например, после падения)
+        with open(path, "r+b") as f:
+            f.truncate(self._segment["bytes"])
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.manifest["fieldnames"])
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._writer = None
+        self._segment = None
+
+    def add_page(self, page_num, rows):
+        """Буферизует страницу; возвращает список записанных страниц, если был сброс"""
+        self._pending_pages.append((page_num, rows))
+        self._pending_rows += len(rows)
+        if self._pending_rows >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Записывает все буферизованные страницы одной транзакцией; возвращает их"""
+        pages = self._pending_pages
+        self._pending_pages = []
+        self._pending_rows = 0
+        self._last_flush = time.monotonic()
+        if not any(rows for _, rows in pages):
+            return pages
+
+        if self._file is None:
+            self._open_segment()
+        for _, rows in pages:
+            self._writer.writerows(rows)
+            self._segment["rows"] += len(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._segment["bytes"] = os.fstat(self._file.fileno()).st_size
+        save_manifest(self.manifest, self.store_dir)
+
+        if self._segment["rows"] >= SEGMENT_MAX_ROWS:
+            self._close_segment()
+        return pages
+
+    def total_rows(self):
+        return self.manifest["total_rows"]
+
+    def close(self):
+        pages = self.flush()
+        self._close_segment()
+        return pages
+
+def _read_segment(segment, store_dir):
+    path = os.path.join(store_dir, segment["file"])
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for i, row in enumerate(reader):
+            if i >= segment["rows"]:
+                break
+            yield row
+
+def iter_rows(store_dir=STORE_DIR):
+    """Строки хранилища в порядке "сначала новые" """
+    for segment in load_manifest(store_dir)["segments"]:
+        if segment["direction"] == HEAD:
+            # Головные сегменты ограничены SEGMENT_MAX_ROWS, их можно развернуть в памяти
+            yield from reversed(list(_read_segment(segment, store_dir)))
+        else:
+            yield from _read_segment(segment, store_dir)
+
+def get_fieldnames(store_dir=STORE_DIR):
+    return load_manifest(store_dir)["fieldnames"]
+
+def export_csv(output_file, store_dir=STORE_DIR):
+    """Выгружает хранилище в один CSV (сначала новые) для eda.py и импорта"""
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=get_fieldnames(store_dir))
+        writer.writeheader()
+        writer.writerows(iter_rows(store_dir))
+
+def migrate_csv(csv_file, store_dir=STORE_DIR):
+    """Переносит старый cars.csv в хранилище как хвостовой сегмент без перезаписи строк"""
+    if exists(store_dir) or not os.path.exists(csv_file):
+        return False
+
+    with open(csv_file, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames or []
+        rows = sum(1 for _ in reader)
+
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = load_manifest(store_dir)
+    manifest["fieldnames"] = list(fieldnames)
+    name = f"segment_{manifest['next_segment_id']:06d}_{TAIL}.csv"
+    manifest["next_segment_id"] += 1
+    os.replace(csv_file, os.path.join(store_dir, name))
+    manifest["segments"].append({
+        "file": name,
+        "direction": TAIL,
+        "rows": rows,
+        "bytes": os.path.getsize(os.path.join(store_dir, name)),
+    })
+    save_manifest(manifest, store_dir)
+    print(f"📦 {csv_file} перенесён в хранилище {store_dir}: {rows} записей")
+    return True
@@ -1,5 +1,6 @@
 import pandas as pd
 from catboost import CatBoostRegressor
+from schema import apply_schema
 
 model = CatBoostRegressor()
 model.load_model("catboost_model.cbm")
@@ -11,6 +12,7 @@ feature_order = [
 ]
 
 def predict_car_price(df: pd.DataFrame) -> int:
-    df_model = df[feature_order].copy()
+    # Те же типы, что и у очищенных данных: категории и узкие целые
+    df_model = apply_schema(df[feature_order])
     predicted_price = int(model.predict(df_model).mean())
     return predicted_price
@@ -0,0 +1,55 @@
+import json
+import os
+from datetime import datetime
+
+# Очередь машин, страницы которых не удалось загрузить даже после повторов.
+# Они не попадают в хранилище и повторяются в следующем цикле парсинга
+DEAD_LETTER_FILE = os.getenv("DEAD_LETTER_FILE", "dead_letter.json")
+# После стольких неудачных циклов ссылка удаляется из очереди
+MAX_ATTEMPTS = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", "5"))
+
+def load(path=DEAD_LETTER_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ошибка чтения очереди ошибок загрузки: {e}")
+        return {}
+
+def save(entries, path=DEAD_LETTER_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def add(failed_items, path=DEAD_LETTER_FILE):
+    """Добавляет неудачные загрузки (результаты AsyncFetcher.fetch_car) в очередь"""
+    if not failed_items:
+        return
+    entries = load(path)
+    now = datetime.now().isoformat(timespec="seconds")
+    for item in failed_items:
+        entry = entries.get(item["url"], {"url": item["url"], "title": item["title"], "attempts": 0})
+        entry["attempts"] += 1
+        entry["last_error"] = item.get("error")
+        entry["updated_at"] = now
+        if entry["attempts"] >= MAX_ATTEMPTS:
+            print(f"Ссылка {item['url']} удалена из очереди после {entry['attempts']} неудачных циклов")
+            entries.pop(item["url"], None)
+        else:
+            entries[item["url"]] = entry
+    save(entries, path)
+
+def remove(urls, path=DEAD_LETTER_FILE):
+    entries = load(path)
+    if not entries:
+        return
+    removed = [url for url in urls if entries.pop(url, None) is not None]
+    if removed:
+        save(entries, path)
+
+def pending_links(path=DEAD_LETTER_FILE):
+    """Ссылки для повторной загрузки в формате parse_listing_html"""
+    return [{"title": entry["title"], "url": entry["url"]} for entry in load(path).values()]
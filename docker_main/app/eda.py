@@ -1,23 +1,27 @@
 import pandas as pd
 import numpy as np
-import sys
+import argparse
+import hashlib
+import json
 import os
+from snapshot import snapshot_path, write_snapshot, SnapshotWriter
+from schema import apply_schema, update_categories, report_memory
 
-# === Получение имени входного файла ===
-input_file = sys.argv[1] if len(sys.argv) > 1 else "new_cars.csv"
+# Накопленная статистика по всей истории для заполнения пропусков в небольших пачках
+EDA_STATS_FILE = os.getenv("EDA_STATS_FILE", "eda_stats.json")
+MODE_COLUMNS = ['engine', 'drive_type', 'body_type']
+DEFAULT_POWER = 150
 
-# === Загрузка данных ===
-df = pd.read_csv(input_file)
-
-# === Очистка от некорректных строк ===
-df.drop(df[df['price_rub'] == 'Цену уточняйте'].index, inplace=True)
-df.drop(df[(df['power'] == 'Не найдено') & (df['engine'] == 'Не найдено')].index, inplace=True)
-df.drop(df[(df['fuel_type'] == 'Не найдено') & (df['engine'] == 'Не найдено')].index, inplace=True)
-
-if 'gear_count' in df.columns:
-    df.drop(columns=['gear_count'], inplace=True)
+# === Потоковый режим (--chunked) для всей истории ===
+# Потолок памяти на обработку одной части (сверх памяти самого интерпретатора с pandas);
+# размер части подбирается по нему
+EDA_MEMORY_MB = int(os.getenv("EDA_MEMORY_MB", "256"))
+# Во сколько раз пик памяти при очистке части больше её размера после чтения (копии колонок)
+CHUNK_MEMORY_FACTOR = 6
+STATS_COLUMNS = ['url', 'price_rub', 'power', 'fuel_type', 'year', 'mileage', 'engine_volume', 'china_price'] + MODE_COLUMNS
 
 # === Функции очистки ===
+# Построчные версии остаются для редких значений, которые не проходят быстрый векторный путь
 def clean_title_simple(title):
     title = title.lower()
     for word in ['import', 'other']:
@@ -36,50 +40,300 @@ def extract_power(value):
         return int(''.join(filter(str.isdigit, value)))
     return np.nan
 
-# === Применение очистки ===
-df['title'] = df['title'].apply(clean_title_simple)
-df['environmental_standards'] = df['environmental_standards'].apply(lambda x: x.replace('Не найдено', 'Euro v I').lower())
-df['transmission'] = df['transmission'].apply(lambda x: x.replace('МТ', 'MT').replace('АТ', 'AT'))
-df['price_rub'] = df['price_rub'].apply(price_to_int)
-
-df['fuel_type'] = df['fuel_type'].replace('Не найдено', 'Бензин')
-
-df['power'] = df['power'].apply(extract_power)
-# Вычисляем среднее значение мощности, игнорируя NaN
-mean_power = df['power'].mean()
-if pd.isna(mean_power):
-    mean_power = 150  # Значение по умолчанию, если все значения NaN
-else:
-    mean_power = int(mean_power)
-df['power'] = df['power'].fillna(mean_power).astype(int)
-
-df['mileage'] = df['mileage'].str.replace('км', '', regex=False).str.replace(' ', '', regex=False).astype(int)
-
-df['engine_volume'] = df['engine_volume'] \
-    .str.replace('см3', '', regex=False) \
-    .str.replace('cм3', '', regex=False) \
-    .str.replace(' ', '', regex=False) \
-    .astype(int)
-
-df['china_price'] = df['china_price'].str.replace('¥', '', regex=False).str.replace(' ', '', regex=False).astype(int)
-
-# === Заполнение пропущенных значений наиболее частыми ===
-# Для engine
-engine_mode = df.loc[df['engine'] != 'Не найдено', 'engine'].mode()
-most_common_engine = engine_mode.iloc[0] if len(engine_mode) > 0 else 'Unknown'
-df['engine'] = df['engine'].replace('Не найдено', most_common_engine)
-
-# Для drive_type
-drive_mode = df.loc[df['drive_type'] != 'Не найдено', 'drive_type'].mode()
-most_common_drive = drive_mode.iloc[0] if len(drive_mode) > 0 else 'Unknown'
-df['drive_type'] = df['drive_type'].replace('Не найдено', most_common_drive)
-
-# Для body_type
-body_mode = df.loc[df['body_type'] != 'Не найдено', 'body_type'].mode()
-most_common_body = body_mode.iloc[0] if len(body_mode) > 0 else 'Unknown'
-df['body_type'] = df['body_type'].replace('Не найдено', most_common_body)
-
-# === Сохранение очищенного файла ===
-output_file = f"clean_{os.path.basename(input_file)}"
-df.to_csv(output_file, index=False, encoding='utf-8')
-print(f"✅ Очищенные данные сохранены в {output_file}")
+# Числовые колонки и единицы, которые снимаются перед разбором.
+# Строки, где после этого остаётся не число ("Не найдено", пусто), удаляются:
+# иначе на них падают strip_units и целые типы schema.py, и теряется вся пачка
+NUMBER_UNITS = {
+    'year': (),
+    'mileage': ('км',),
+    'engine_volume': ('см3', 'cм3'),
+    'china_price': ('¥',),
+}
+
+def unparseable_numbers_mask(df):
+    mask = pd.Series(False, index=df.index)
+    for column, units in NUMBER_UNITS.items():
+        values = df[column].astype(str)
+        for unit in units + (' ',):
+            values = values.str.replace(unit, '', regex=False)
+        mask |= ~values.str.fullmatch(r'[0-9]+').fillna(False).astype(bool)
+    return mask
+
+def invalid_rows_mask(df):
+    """Все условия удаления строк одной маской"""
+    not_found_engine = df['engine'] == 'Не найдено'
+    return (
+        (df['price_rub'] == 'Цену уточняйте')
+        | ((df['power'] == 'Не найдено') & not_found_engine)
+        | ((df['fuel_type'] == 'Не найдено') & not_found_engine)
+        | unparseable_numbers_mask(df)
+    )
+
+# Все символы, которые str.split() считает пробельными
+WHITESPACE_RE = '[\t-\r\x1c-\x20\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+'
+
+def clean_titles(titles):
+    titles = titles.str.lower().str.replace('import', '', regex=False).str.replace('other', '', regex=False)
+    # Аналог ' '.join(title.split()) без построчного вызова Python
+    return titles.str.replace(WHITESPACE_RE, ' ', regex=True).str.strip(' ')
+
+def prices_to_int(prices):
+    cleaned = prices.astype(str).str.replace(' ', '', regex=False).str.replace('₽', '', regex=False)
+    simple = cleaned.str.fullmatch(r'[0-9]+').fillna(False).astype(bool)
+    result = pd.Series(0, index=prices.index, dtype='int64')
+    result[simple] = cleaned[simple].astype('int64')
+    if not simple.all():
+        # Остальное (пустые цены, "по запросу" и т.п.) разбираем как раньше
+        rest = cleaned[~simple].map(price_to_int)
+        if rest.isna().any():
+            result = result.astype(float)
+            rest = rest.astype(float)
+        result[~simple] = rest
+    return result
+
+def extract_powers(powers):
+    if pd.api.types.is_numeric_dtype(powers):
+        return pd.Series(np.nan, index=powers.index)
+    valid = (powers != 'Не найдено') & powers.notna()
+    # Цифры вне ASCII (², арабские и т.п.) обрабатываются построчно, как раньше
+    unusual = valid & powers.str.contains(r'[^\x00-\x7FЀ-ӿ]', regex=True).fillna(False).astype(bool)
+    simple = valid & ~unusual
+    result = pd.Series(np.nan, index=powers.index)
+    result[simple] = powers[simple].str.replace(r'[^0-9]', '', regex=True).astype('int64')
+    if unusual.any():
+        result[unusual] = powers[unusual].map(extract_power)
+    if not result.isna().any():
+        result = result.astype('int64')
+    return result
+
+def strip_units(values, *units):
+    for unit in units + (' ',):
+        values = values.str.replace(unit, '', regex=False)
+    return values.astype(int)
+
+def most_common(values, default='Unknown'):
+    mode = values[values != 'Не найдено'].mode()
+    return mode.iloc[0] if len(mode) > 0 else default
+
+def prepare_cars(df):
+    """Очистка без заполнения пропусков: mean_power и моды зависят от статистики"""
+    # === Очистка от некорректных строк ===
+    df = df.loc[~invalid_rows_mask(df)]
+    if 'gear_count' in df.columns:
+        df = df.drop(columns=['gear_count'])
+    else:
+        df = df.copy()
+
+    # === Применение очистки ===
+    df['title'] = clean_titles(df['title'])
+    df['environmental_standards'] = df['environmental_standards'].str.replace('Не найдено', 'Euro v I', regex=False).str.lower()
+    df['transmission'] = df['transmission'].str.replace('МТ', 'MT', regex=False).str.replace('АТ', 'AT', regex=False)
+    df['price_rub'] = prices_to_int(df['price_rub'])
+
+    df['fuel_type'] = df['fuel_type'].replace('Не найдено', 'Бензин')
+    df['power'] = extract_powers(df['power'])
+
+    df['mileage'] = strip_units(df['mileage'], 'км')
+    df['engine_volume'] = strip_units(df['engine_volume'], 'см3', 'cм3')
+    df['china_price'] = strip_units(df['china_price'], '¥')
+    return df
+
+# === Статистика для заполнения пропусков ===
+def empty_stats():
+    return {"rows": 0, "power_sum": 0, "power_count": 0, "frequencies": {column: {} for column in MODE_COLUMNS}}
+
+def batch_stats(df):
+    """Сумма/число мощностей и частоты значений по подготовленной пачке"""
+    power = df['power'].dropna()
+    stats = empty_stats()
+    stats["rows"] = len(df)
+    stats["power_sum"] = int(power.sum())
+    stats["power_count"] = int(len(power))
+    for column in MODE_COLUMNS:
+        values = df[column]
+        stats["frequencies"][column] = {
+            str(value): int(count) for value, count in values[values != 'Не найдено'].value_counts().items()
+        }
+    return stats
+
+def merge_stats(stats, batch):
+    """Добавляет статистику пачки к накопленной за O(размер пачки)"""
+    stats["rows"] += batch["rows"]
+    stats["power_sum"] += batch["power_sum"]
+    stats["power_count"] += batch["power_count"]
+    for column in MODE_COLUMNS:
+        frequencies = stats["frequencies"].setdefault(column, {})
+        for value, count in batch["frequencies"][column].items():
+            frequencies[value] = frequencies.get(value, 0) + count
+    return stats
+
+def stats_mean_power(stats):
+    if not stats["power_count"]:
+        return DEFAULT_POWER  # Значение по умолчанию, если мощность нигде не указана
+    return int(stats["power_sum"] / stats["power_count"])
+
+def stats_mode(stats, column, default='Unknown'):
+    frequencies = stats["frequencies"].get(column) or {}
+    if not frequencies:
+        return default
+    # При равных частотах берём меньшее значение, как Series.mode()
+    top = max(frequencies.values())
+    return min(value for value, count in frequencies.items() if count == top)
+
+def impute_cars(df, stats):
+    df['power'] = df['power'].fillna(stats_mean_power(stats)).astype(int)
+    # === Заполнение пропущенных значений наиболее частыми ===
+    for column in MODE_COLUMNS:
+        df[column] = df[column].replace('Не найдено', stats_mode(stats, column))
+    return df
+
+def load_stats(path=EDA_STATS_FILE):
+    if not os.path.exists(path):
+        return empty_stats()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_stats(stats, path=EDA_STATS_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def urls_digest(urls, digest=0):
+    # Сумма хешей не зависит от порядка строк и считается по частям
+    for url in urls:
+        digest = (digest + int.from_bytes(hashlib.sha1(url.encode("utf-8")).digest(), "big")) % (1 << 160)
+    return digest
+
+def batch_id(df):
+    """Отпечаток пачки по URL, чтобы повторная обработка того же файла не учитывалась дважды"""
+    return f"{urls_digest(df['url'].astype(str)):040x}"
+
+def clean_cars(df, stats=None):
+    """Очистка сырых данных парсера для импорта и обучения.
+
+    Без stats пропуски заполняются по самой пачке. С накопленной статистикой
+    пачка сначала добавляется к ней (stats меняется на месте), а заполнение
+    идёт по статистике всей истории.
+    """
+    df = prepare_cars(df)
+    batch = batch_stats(df)
+    if stats is None:
+        stats = batch
+    else:
+        merge_stats(stats, batch)
+    return impute_cars(df, stats)
+
+def estimate_chunk_rows(input_file, memory_mb=EDA_MEMORY_MB, sample_rows=1000):
+    """Сколько строк читать за раз, чтобы очистка части укладывалась в memory_mb"""
+    sample = pd.read_csv(input_file, nrows=sample_rows)
+    if sample.empty:
+        return sample_rows
+    row_bytes = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(sample_rows, int(memory_mb * 1024 * 1024 / (row_bytes * CHUNK_MEMORY_FACTOR)))
+
+def scan_stats(input_file, chunk_rows):
+    """Первый, дешёвый проход: только колонки для статистики, без записи.
+
+    Возвращает статистику пачки и её отпечаток.
+    """
+    stats = empty_stats()
+    digest = 0
+    for chunk in pd.read_csv(input_file, usecols=STATS_COLUMNS, chunksize=chunk_rows):
+        digest = urls_digest(chunk['url'].astype(str), digest)
+        chunk = chunk.loc[~invalid_rows_mask(chunk)].copy()
+        chunk['power'] = extract_powers(chunk['power'])
+        merge_stats(stats, batch_stats(chunk))
+    return stats, f"{digest:040x}"
+
+def clean_file_chunked(input_file, output_file, snapshot_file, stats, chunk_rows):
+    """Второй проход: очистка по частям с дозаписью CSV и снимка"""
+    rows = 0
+    snapshot_writer = SnapshotWriter(snapshot_file)
+    try:
+        with open(output_file, "w", newline="", encoding="utf-8") as f:
+            for chunk in pd.read_csv(input_file, chunksize=chunk_rows):
+                df = impute_cars(prepare_cars(chunk), stats)
+                # Словари категорий общие для всех частей, типы колонок совпадают
+                df = apply_schema(df, update_categories(df))
+                # Заголовок один раз, даже если первые части отфильтрованы целиком
+                df.to_csv(f, index=False, header=(f.tell() == 0))
+                snapshot_writer.write(df)
+                rows += len(df)
+    finally:
+        snapshot_writer.close()
+    return rows
+
+def clean_batch(raw, full=False, stats_path=EDA_STATS_FILE):
+    """Очистка пачки в памяти с заполнением пропусков по накопленной статистике.
+
+    full=True — пачка содержит всю историю, статистика пересчитывается с нуля.
+    Возвращает (очищенные данные, статистика с учётом пачки). Статистика не
+    сохраняется: вызывающий сохраняет её через save_stats, когда пачка
+    действительно импортирована, иначе машины попали бы в статистику, так и
+    не дойдя до графа.
+    """
+    stats = empty_stats() if full else load_stats(stats_path)
+    raw_id = batch_id(raw)
+    if stats.get("last_batch") == raw_id:
+        # Пачка уже учтена в статистике, только заполняем пропуски
+        df = impute_cars(prepare_cars(raw), stats)
+    else:
+        df = clean_cars(raw, stats)
+        stats["last_batch"] = raw_id
+    typed = apply_schema(df, update_categories(df))
+    print(f"📊 Статистика для заполнения пропусков: {stats['rows']} машин, средняя мощность {stats_mean_power(stats)}")
+    report_memory(df, typed)
+    return typed, stats
+
+def clean_file_bounded(input_file, output_file, snapshot_file, full=False, chunk_rows=None, stats_path=EDA_STATS_FILE):
+    """Потоковая очистка файла в два прохода с ограничением памяти; возвращает статистику, не сохраняя её"""
+    chunk_rows = chunk_rows or estimate_chunk_rows(input_file)
+    print(f"🧩 Потоковая очистка {input_file} частями по {chunk_rows} строк")
+    batch, raw_id = scan_stats(input_file, chunk_rows)
+    stats = empty_stats() if full else load_stats(stats_path)
+    if stats.get("last_batch") != raw_id:
+        merge_stats(stats, batch)
+        stats["last_batch"] = raw_id
+    print(f"📊 Статистика для заполнения пропусков: {stats['rows']} машин, средняя мощность {stats_mean_power(stats)}")
+    rows = clean_file_chunked(input_file, output_file, snapshot_file, stats, chunk_rows)
+    print(f"✅ Очищенные данные сохранены в {output_file} ({rows} строк) и {snapshot_file}")
+    return stats
+
+def clean_file(input_file, full=False, chunked=False, chunk_rows=None):
+    """Очистка CSV с записью clean_<имя>.csv и снимка .parquet.
+
+    Возвращает (путь к снимку, статистика); статистику сохраняет вызывающий, как в clean_batch.
+    """
+    output_file = f"clean_{os.path.basename(input_file)}"
+    snapshot_file = snapshot_path(output_file)
+    if chunked:
+        stats = clean_file_bounded(input_file, output_file, snapshot_file, full, chunk_rows)
+        return snapshot_file, stats
+
+    # === Загрузка и очистка данных ===
+    df, stats = clean_batch(pd.read_csv(input_file), full)
+
+    # === Сохранение очищенного файла ===
+    df.to_csv(output_file, index=False, encoding='utf-8')
+    print(f"✅ Очищенные данные сохранены в {output_file}")
+
+    # === Типизированный колоночный снимок для импорта и обучения ===
+    write_snapshot(df, snapshot_file)
+    print(f"✅ Снимок сохранён в {snapshot_file}")
+    return snapshot_file, stats
+
+def main():
+    # === Получение имени входного файла ===
+    arg_parser = argparse.ArgumentParser(description="Очистка данных парсера")
+    arg_parser.add_argument("input_file", nargs="?", default="new_cars.csv")
+    arg_parser.add_argument("--full", action="store_true", help="вся история: статистика пересчитывается с нуля")
+    arg_parser.add_argument("--chunked", action="store_true", help="обработка по частям с ограничением памяти")
+    arg_parser.add_argument("--chunk-rows", type=int, default=None, help="размер части (по умолчанию по EDA_MEMORY_MB)")
+    args = arg_parser.parse_args()
+    _, stats = clean_file(args.input_file, args.full, args.chunked, args.chunk_rows)
+    # Отдельный запуск eda ничего не импортирует: данные готовы, как только записаны файлы
+    save_stats(stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+import aiohttp
+from metrics import metrics
+
+# === Настройки загрузки ===
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "24"))
+REQUEST_TIMEOUT = 30
+KEEPALIVE_TIMEOUT = 60
+
+# === Повторы и ограничение частоты запросов ===
+MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "3"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Начальная, минимальная и максимальная частота запросов к одному хосту, запросов/с
+RATE_LIMIT = float(os.getenv("FETCH_RATE_LIMIT", "20"))
+RATE_LIMIT_MIN = float(os.getenv("FETCH_RATE_LIMIT_MIN", "1"))
+RATE_LIMIT_MAX = float(os.getenv("FETCH_RATE_LIMIT_MAX", "50"))
+RATE_LIMIT_BURST = 10
+# Если ответы медленнее этого, сайт перегружен — частоту снижаем, с.
+LATENCY_TARGET = 5.0
+
+# br не указываем: aiohttp распаковывает brotli только при установленном пакете Brotli
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+def classify_error(error):
+    """Короткий тип ошибки загрузки для метрик"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"http_{error.status}"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return type(error).__name__
+
+def is_retryable(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+def is_throttled(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, asyncio.TimeoutError)
+
+def get_retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Экспоненциальная задержка с джиттером; Retry-After от сайта имеет приоритет"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, BACKOFF_MAX))
+    return delay
+
+class HostRateLimiter:
+    """Token bucket для одного хоста с адаптивной частотой (AIMD).
+
+    Успешные быстрые ответы понемногу повышают частоту, ответы 429/5xx
+    и таймауты уменьшают её вдвое, медленные ответы — на 10%.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self, latency):
+        if latency > LATENCY_TARGET:
+            self.rate = max(self.min_rate, self.rate * 0.9)
+        else:
+            self.rate = min(self.max_rate, self.rate + 0.5)
+
+    def on_throttled(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+
+class AsyncFetcher:
+    """Асинхронный загрузчик страниц с общим пулом keep-alive соединений.
+
+    Событийный цикл и HTTP-сессия живут всё время работы загрузчика,
+    поэтому TCP/TLS-соединения с хостом переиспользуются между страницами
+    и циклами парсинга. Снаружи загрузчик используется синхронно.
+    """
+
+    def __init__(self, concurrency=None, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES):
+        self.concurrency = concurrency or FETCH_CONCURRENCY
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+        self._limiters = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            # Лимит соединений на хост и есть ограничение параллельности
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.concurrency,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def get_limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = HostRateLimiter()
+        return self._limiters[host]
+
+    async def fetch_text(self, url, stage="listing_fetch"):
+        """Загрузка с ограничением частоты и повторами при 429/5xx, таймаутах и обрывах"""
+        limiter = self.get_limiter(url)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                html = await self._fetch_once(url, stage)
+                limiter.on_success(time.perf_counter() - start)
+                return html
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                if is_throttled(e):
+                    limiter.on_throttled()
+                metrics.inc("retries")
+                await asyncio.sleep(backoff_delay(attempt, get_retry_after(e)))
+
+    async def _fetch_once(self, url, stage):
+        session = await self._get_session()
+        start = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                body = await response.read()
+                metrics.inc("bytes_downloaded", len(body))
+                return await response.text()
+        except Exception as e:
+            metrics.error(stage, classify_error(e))
+            raise
+        finally:
+            metrics.inc("requests")
+            metrics.observe(stage, time.perf_counter() - start)
+
+    async def fetch_car(self, car_info):
+        url = car_info["url"]
+        title = car_info.get("title", "Неизвестно")
+        try:
+            html = await self.fetch_text(url, stage="detail_fetch")
+            fetched_at = datetime.now().isoformat(timespec="seconds")
+            return {"url": url, "title": title, "html": html, "status": "success", "fetched_at": fetched_at}
+        except Exception as e:
+            return {"url": url, "title": title, "html": None, "status": "error", "error": str(e) or type(e).__name__}
+
+    async def fetch_cars(self, car_links):
+        return await asyncio.gather(*(self.fetch_car(car) for car in car_links))
+
+    def run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    def get_html(self, url):
+        """Загружает одну страницу (например, страницу списка)"""
+        return self.run(self.fetch_text(url))
+
+    def get_cars_html(self, car_links):
+        """Загружает страницы машин параллельно, сохраняя порядок ссылок"""
+        if not car_links:
+            return []
+        return self.run(self.fetch_cars(car_links))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        if self._session is not None and not self._session.closed:
+            self._loop.run_until_complete(self._session.close())
+        self._loop.close()
@@ -0,0 +1,69 @@
+import time
+from import_neo4j import DIMENSIONS
+
+# Ограничения уникальности по ключам MERGE из import_neo4j.DIMENSIONS:
+# каждое создаёт индекс, поэтому MERGE и поиск по этим свойствам не сканируют все узлы метки
+CONSTRAINTS = [("car_title_url", "Car", ["title", "url"])] + [
+    (f"{label.lower()}_{'_'.join(properties)}", label, list(properties))
+    for _, label, properties, _ in DIMENSIONS
+]
+# Индексы под условия запросов бота, которые не покрыты ограничениями
+# (составной индекс (title, url) не используется для поиска только по title)
+INDEXES = [
+    ("car_title", "Car", ["title"]),
+    ("car_url", "Car", ["url"]),
+]
+INDEX_WAIT_SECONDS = 300
+
+def _properties(properties):
+    return ", ".join(f"n.{name}" for name in properties)
+
+def ensure_graph_schema(driver, wait=True):
+    """Идемпотентно создаёт ограничения и индексы графа машин и печатает их состояние"""
+    start = time.perf_counter()
+    with driver.session() as session:
+        for name, label, properties in CONSTRAINTS:
+            try:
+                session.run(
+                    f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+                    f"FOR (n:{label}) REQUIRE ({_properties(properties)}) IS UNIQUE"
+                ).consume()
+            except Exception as e:
+                # Например, в графе уже есть дубликаты: MERGE всё равно ускорит обычный индекс
+                print(f"⚠️ Ограничение {name} не создано ({e}), создаём индекс")
+                session.run(
+                    f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({_properties(properties)})"
+                ).consume()
+        for name, label, properties in INDEXES:
+            session.run(f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({_properties(properties)})").consume()
+        if wait:
+            session.run("CALL db.awaitIndexes($timeout)", timeout=INDEX_WAIT_SECONDS).consume()
+    print(f"🗂️ Схема графа проверена за {time.perf_counter() - start:.2f} с")
+    report_indexes(driver)
+
+def index_states(driver):
+    with driver.session() as session:
+        result = session.run("""
+            SHOW INDEXES YIELD name, type, labelsOrTypes, properties, state, populationPercent
+            WHERE type <> 'LOOKUP'
+            RETURN name, type, labelsOrTypes, properties, state, populationPercent
+            ORDER BY name
+        """)
+        return [record.data() for record in result]
+
+def report_indexes(driver):
+    for index in index_states(driver):
+        label = ",".join(index["labelsOrTypes"] or [])
+        properties = ",".join(index["properties"] or [])
+        mark = "✅" if index["state"] == "ONLINE" else "⏳"
+        print(f"{mark} {index['name']:22} {index['type']:6} :{label}({properties}) "
+              f"{index['state']} {index['populationPercent']:.0f}%")
+
+def drop_graph_schema(driver):
+    """Удаляет ограничения и индексы из CONSTRAINTS/INDEXES (для замеров без индексов)"""
+    with driver.session() as session:
+        for name, _, _ in CONSTRAINTS:
+            session.run(f"DROP CONSTRAINT {name} IF EXISTS").consume()
+            session.run(f"DROP INDEX {name} IF EXISTS").consume()
+        for name, _, _ in INDEXES:
+            session.run(f"DROP INDEX {name} IF EXISTS").consume()
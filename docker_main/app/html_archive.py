@@ -0,0 +1,270 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+import zlib
+
+# Архив сырых страниц машин: повторное извлечение полей после исправлений
+# парсера без повторной загрузки сайта.
+# Каталог с сегментами segment_NNNNNN.arc, которые только дописываются.
+# Сегмент — последовательность кадров, по кадру на записанную пачку страниц:
+#   [длина][заголовок JSON: url и время загрузки каждой страницы][длина][тело: zlib(JSON)]
+# Заголовок не сжат, поэтому список страниц читается без распаковки HTML.
+ARCHIVE_DIR = os.getenv("HTML_ARCHIVE_DIR", "html_archive")
+# "0" отключает запись архива
+ARCHIVE_ENABLED = os.getenv("HTML_ARCHIVE", "1") != "0"
+SEGMENT_MAX_BYTES = int(os.getenv("HTML_ARCHIVE_SEGMENT_MB", "256")) * 1024 * 1024
+COMPRESSION_LEVEL = int(os.getenv("HTML_ARCHIVE_COMPRESSION", "6"))
+
+_LENGTH = struct.Struct(">I")
+# Сегменты, хвост которых уже проверен в этом процессе
+_checked_segments = set()
+
+def segment_files(archive_dir=ARCHIVE_DIR):
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        os.path.join(archive_dir, name)
+        for name in os.listdir(archive_dir)
+        if name.startswith("segment_") and name.endswith(".arc")
+    )
+
+def _read_block(f):
+    raw_length = f.read(_LENGTH.size)
+    if len(raw_length) < _LENGTH.size:
+        return None
+    (length,) = _LENGTH.unpack(raw_length)
+    data = f.read(length)
+    if len(data) < length:
+        return None
+    return data
+
+def _iter_segment(path, with_body=True):
+    """Кадры сегмента: (заголовок, сжатое тело или None). Недописанный кадр в конце пропускается"""
+    with open(path, "rb") as f:
+        while True:
+            header = _read_block(f)
+            if header is None:
+                return
+            if with_body:
+                body = _read_block(f)
+                if body is None:
+                    return
+            else:
+                raw_length = f.read(_LENGTH.size)
+                if len(raw_length) < _LENGTH.size:
+                    return
+                (length,) = _LENGTH.unpack(raw_length)
+                if f.seek(length, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                    return
+                body = None
+            yield json.loads(header), body
+
+def _valid_size(path):
+    """Размер сегмента до конца последнего целого кадра"""
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            header = _read_block(f)
+            raw_length = f.read(_LENGTH.size) if header is not None else b""
+            if len(raw_length) < _LENGTH.size:
+                return size
+            (length,) = _LENGTH.unpack(raw_length)
+            if f.seek(length, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                return size
+            size = f.tell()
+
+def _current_segment(archive_dir):
+    segments = segment_files(archive_dir)
+    if segments and os.path.getsize(segments[-1]) < SEGMENT_MAX_BYTES:
+        return segments[-1]
+    return os.path.join(archive_dir, f"segment_{len(segments) + 1:06d}.arc")
+
+def append(pages, archive_dir=ARCHIVE_DIR):
+    """Дописывает успешно загруженные страницы (результаты AsyncFetcher.fetch_car) одним кадром"""
+    if not ARCHIVE_ENABLED or not pages:
+        return
+    os.makedirs(archive_dir, exist_ok=True)
+    path = _current_segment(archive_dir)
+    if path not in _checked_segments and os.path.exists(path):
+        # Отбрасываем кадр, недописанный при падении, иначе следующие станут нечитаемыми
+        with open(path, "r+b") as f:
+            f.truncate(_valid_size(path))
+    _checked_segments.add(path)
+
+    header = json.dumps({"pages": [[page["url"], page["fetched_at"]] for page in pages]}, ensure_ascii=False)
+    body = json.dumps([
+        {"url": page["url"], "title": page["title"], "fetched_at": page["fetched_at"], "html": page["html"]}
+        for page in pages
+    ], ensure_ascii=False)
+    header = header.encode("utf-8")
+    body = zlib.compress(body.encode("utf-8"), COMPRESSION_LEVEL)
+    with open(path, "ab") as f:
+        f.write(_LENGTH.pack(len(header)) + header + _LENGTH.pack(len(body)) + body)
+        f.flush()
+        os.fsync(f.fileno())
+
+def latest_positions(archive_dir=ARCHIVE_DIR):
+    """Первый проход по заголовкам: url -> (номер кадра, номер страницы) последней загрузки"""
+    positions = {}
+    frame_num = 0
+    for path in segment_files(archive_dir):
+        for header, _ in _iter_segment(path, with_body=False):
+            for index, (url, fetched_at) in enumerate(header["pages"]):
+                positions[url] = (frame_num, index)
+            frame_num += 1
+    return positions
+
+def reextract_frame(body, keep):
+    """Воркер: распаковка кадра и извлечение (строка, время загрузки) для страниц с индексами keep"""
+    import parser as car_parser
+
+    rows = []
+    for index, page in enumerate(json.loads(zlib.decompress(body))):
+        if index not in keep:
+            continue
+        try:
+            fields = car_parser.extract_car_fields(page["html"])
+        except Exception:
+            fields = ("Ошибка", "Ошибка", "Ошибка")
+        rows.append((car_parser.build_car_row(car_parser.make_car_details(page, fields)), page["fetched_at"]))
+    return rows
+
+def _copy_unarchived(order_db, store_dir, positions):
+    """Позиции URL в текущем хранилище (сначала новые); строки без страницы в архиве
+    (перенесённые из старого cars.csv, собранные до появления архива) копируются как есть.
+
+    Возвращает (url -> позиция, число скопированных строк).
+    """
+    import car_store
+
+    ranks = {}
+    kept = 0
+    if not car_store.exists(store_dir):
+        return ranks, kept
+    for rank, row in enumerate(car_store.iter_rows(store_dir)):
+        ranks.setdefault(row["url"], rank)
+        if row["url"] not in positions:
+            # url_index считает эти URL увиденными, поэтому заново они не загрузятся
+            order_db.execute("INSERT INTO rows VALUES (?, ?, ?)", (rank, "", json.dumps(row, ensure_ascii=False)))
+            kept += 1
+    return ranks, kept
+
+def _swap_store(new_dir, store_dir):
+    old_dir = store_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(new_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def reextract(store_dir=None, archive_dir=ARCHIVE_DIR, workers=None):
+    """Пересобирает хранилище машин из архива без сети: по одной строке на URL, последняя загрузка побеждает.
+
+    Новое хранилище собирается рядом и подменяет старое только целиком. Порядок
+    "сначала новые" берётся из текущего хранилища; URL, которых в нём нет, идут
+    в конце, от последних загруженных. Строки хранилища без страницы в архиве
+    остаются на своих местах без изменений. Запускать при остановленном парсере.
+    """
+    import car_store
+    import parser as car_parser
+
+    store_dir = store_dir or car_store.STORE_DIR
+    start = time.perf_counter()
+    positions = latest_positions(archive_dir)
+    print(f"В архиве {len(positions)} уникальных страниц")
+    workers = workers or os.cpu_count() or 1
+    written = 0
+    frame_num = 0
+    archive_bytes = 0
+    new_dir = store_dir + ".reextract"
+    shutil.rmtree(new_dir, ignore_errors=True)
+    os.makedirs(new_dir)
+    # Строки идут из архива в порядке загрузки; SQLite сортирует их на диске, а не в памяти
+    order_db = sqlite3.connect(os.path.join(new_dir, "order.sqlite"))
+    order_db.execute("CREATE TABLE rows (rank INTEGER, fetched_at TEXT, row TEXT)")
+    ranks, kept = _copy_unarchived(order_db, store_dir, positions)
+    unranked = len(ranks)
+    if kept:
+        print(f"⚠️ {kept} записей хранилища без страницы в архиве переносятся без изменений")
+    # Поля старых строк сохраняются вместе с полями парсера
+    fieldnames = sorted(set(car_store.get_fieldnames(store_dir)) | set(car_parser.CAR_FIELDNAMES))
+
+    def collect(future):
+        rows = future.result()
+        order_db.executemany("INSERT INTO rows VALUES (?, ?, ?)", [
+            (ranks.get(row["url"], unranked), fetched_at, json.dumps(row, ensure_ascii=False))
+            for row, fetched_at in rows
+        ])
+        return len(rows)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Окно ограничивает число кадров в работе: чтение не убегает вперёд воркеров
+        pending = collections.deque()
+        for path in segment_files(archive_dir):
+            archive_bytes += os.path.getsize(path)
+            for header, body in _iter_segment(path):
+                keep = {
+                    index for index, (url, _) in enumerate(header["pages"])
+                    if positions.get(url) == (frame_num, index)
+                }
+                frame_num += 1
+                if not keep:
+                    continue
+                pending.append(executor.submit(reextract_frame, body, keep))
+                if len(pending) >= workers * 2:
+                    written += collect(pending.popleft())
+        while pending:
+            written += collect(pending.popleft())
+    order_db.commit()
+
+    with car_store.TailWriter(fieldnames, store_dir=new_dir) as writer:
+        batch = []
+        for (row,) in order_db.execute("SELECT row FROM rows ORDER BY rank, fetched_at DESC"):
+            batch.append(json.loads(row))
+            if len(batch) >= car_store.FLUSH_ROWS:
+                writer.add_page(None, batch)
+                batch = []
+        writer.add_page(None, batch)
+    order_db.close()
+    os.remove(os.path.join(new_dir, "order.sqlite"))
+    _swap_store(new_dir, store_dir)
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {store_dir}: {written} записей из {frame_num} кадров и {kept} без изменений за {elapsed:.1f} с "
+          f"({archive_bytes / 1024 / 1024 / max(elapsed, 1e-9):.1f} МБ/с сжатого архива)")
+    return written
+
+def stats(archive_dir=ARCHIVE_DIR):
+    segments = segment_files(archive_dir)
+    pages = sum(len(header["pages"]) for path in segments for header, _ in _iter_segment(path, with_body=False))
+    size = sum(os.path.getsize(path) for path in segments)
+    print(f"Архив {archive_dir}: {len(segments)} сегментов, {pages} страниц, {size / 1024 / 1024:.1f} МБ")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Архив сырых страниц машин")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    reextract_cmd = commands.add_parser("reextract", help="пересобрать хранилище машин из архива без сети")
+    reextract_cmd.add_argument("--store", default=None, help="каталог хранилища (по умолчанию car_store.STORE_DIR)")
+    reextract_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+    reextract_cmd.add_argument("--workers", type=int, default=None)
+
+    stats_cmd = commands.add_parser("stats", help="размер архива")
+    stats_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+
+    args = arg_parser.parse_args()
+    if args.command == "reextract":
+        reextract(args.store, args.archive, args.workers)
+        # Граф в Neo4j строится из хранилища только при первом полном импорте
+        print("Чтобы загрузить пересобранные данные в Neo4j, удалите import_flag.txt и перезапустите main.py")
+    else:
+        stats(args.archive)
+
+if __name__ == "__main__":
+    main()
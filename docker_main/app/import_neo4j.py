@@ -1,7 +1,14 @@
 import pandas as pd
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+import argparse
 import os
-import sys
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from snapshot import read_table
+from schema import apply_schema, report_memory
 
 # Проверяем, используется ли Docker (dotenv только для локальной разработки)
 if os.getenv('DOCKER_ENV') != 'true':
@@ -13,75 +20,213 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
-# === Инициализация драйвера ===
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-def import_car(tx, row):
-    tx.run("""
-        MERGE (c:Car {title: toLower($title), url: $url})
-        MERGE (y:Year {value: $year})
-        MERGE (t:Transmission {type: $transmission})
-        MERGE (clr:Color {name: $color})
-        MERGE (d:Drive {type: $drive})
-        MERGE (e:Engine {code: $engine, volume: $volume})
-        MERGE (b:BodyType {type: $body})
-        MERGE (env:EnvStandard {standard: $standard})
-        MERGE (f:Fuel {type: $fuel})
-        MERGE (a:Auction {location: $auction})
-
-        MERGE (m:Mileage {value: $mileage})
-        MERGE (p:Power {value: $power})
-        MERGE (cp:ChinaPrice {value: $china_price})
-        MERGE (pr:PriceRUB {value: $price_rub})
-
-        MERGE (c)-[:HAS_YEAR]->(y)
-        MERGE (c)-[:HAS_TRANSMISSION]->(t)
-        MERGE (c)-[:HAS_COLOR]->(clr)
-        MERGE (c)-[:HAS_DRIVE]->(d)
-        MERGE (c)-[:HAS_ENGINE]->(e)
-        MERGE (c)-[:HAS_BODY]->(b)
-        MERGE (c)-[:HAS_ENV_STANDARD]->(env)
-        MERGE (c)-[:HAS_FUEL_TYPE]->(f)
-        MERGE (c)-[:FROM_AUCTION]->(a)
-
-        MERGE (c)-[:HAS_MILEAGE]->(m)
-        MERGE (c)-[:HAS_POWER]->(p)
-        MERGE (c)-[:HAS_CHINA_PRICE]->(cp)
-        MERGE (c)-[:HAS_PRICE_RUB]->(pr)
-    """, {
-        "title": row["title"],
-        "url": row["url"],
-        "year": int(row["year"]),
-        "transmission": row["transmission"],
-        "color": row["color"],
-        "drive": row["drive_type"],
-        "engine": row["engine"],
-        "volume": float(row["engine_volume"]),
-        "body": row["body_type"],
-        "standard": row["environmental_standards"],
-        "fuel": row["fuel_type"],
-        "auction": row["auction"],
-        "mileage": int(row["mileage"]),
-        "power": int(row["power"]),
-        "china_price": int(row["china_price"]),
-        "price_rub": int(row["price_rub"])
+# === Настройки пакетного импорта ===
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Повторы пачки сверх встроенных повторов execute_write (например, при перезапуске Neo4j)
+IMPORT_MAX_RETRIES = int(os.getenv("IMPORT_MAX_RETRIES", "3"))
+IMPORT_RETRY_DELAY = 5
+# Параллельные сессии второй фазы импорта (машины и связи)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+
+def create_driver():
+    """Один драйвер на процесс: пул соединений переиспользуется между пачками"""
+    return GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+
+# Граф машин: узел Car {title: toLower(title), url} и по узлу каждого измерения.
+# Единственное описание графа — по нему строятся запросы импорта, ограничения
+# graph_schema.py и файлы bulk_load.py.
+# Измерение: (переменная, метка, {свойство: параметр}, связь от Car)
+DIMENSIONS = [
+    ("y", "Year", {"value": "year"}, "HAS_YEAR"),
+    ("t", "Transmission", {"type": "transmission"}, "HAS_TRANSMISSION"),
+    ("clr", "Color", {"name": "color"}, "HAS_COLOR"),
+    ("d", "Drive", {"type": "drive"}, "HAS_DRIVE"),
+    ("e", "Engine", {"code": "engine", "volume": "volume"}, "HAS_ENGINE"),
+    ("b", "BodyType", {"type": "body"}, "HAS_BODY"),
+    ("env", "EnvStandard", {"standard": "standard"}, "HAS_ENV_STANDARD"),
+    ("f", "Fuel", {"type": "fuel"}, "HAS_FUEL_TYPE"),
+    ("a", "Auction", {"location": "auction"}, "FROM_AUCTION"),
+    ("m", "Mileage", {"value": "mileage"}, "HAS_MILEAGE"),
+    ("p", "Power", {"value": "power"}, "HAS_POWER"),
+    ("cp", "ChinaPrice", {"value": "china_price"}, "HAS_CHINA_PRICE"),
+    ("pr", "PriceRUB", {"value": "price_rub"}, "HAS_PRICE_RUB"),
+]
+# Параметр запроса: (колонка очищенных данных, тип)
+PARAM_COLUMNS = {
+    "title": ("title", str),
+    "url": ("url", str),
+    "year": ("year", "int64"),
+    "transmission": ("transmission", str),
+    "color": ("color", str),
+    "drive": ("drive_type", str),
+    "engine": ("engine", str),
+    "volume": ("engine_volume", float),
+    "body": ("body_type", str),
+    "standard": ("environmental_standards", str),
+    "fuel": ("fuel_type", str),
+    "auction": ("auction", str),
+    "mileage": ("mileage", "int64"),
+    "power": ("power", "int64"),
+    "china_price": ("china_price", "int64"),
+    "price_rub": ("price_rub", "int64"),
+}
+
+def _pattern(var, label, properties):
+    fields = ", ".join(f"{name}: row.{param}" for name, param in properties.items())
+    return f"({var}:{label} {{{fields}}})"
+
+def dimension_query(label, properties):
+    return f"UNWIND $rows AS row MERGE {_pattern('n', label, properties)}"
+
+# Фаза 2: только узлы Car
+CARS_QUERY = "UNWIND $rows AS row\nMERGE (c:Car {title: toLower(row.title), url: row.url})"
+CAR_PARAMS = ["title", "url"]
+
+def relationship_query(var, label, properties, relationship):
+    """Фаза 3: связи одного измерения; оба конца уже созданы, поэтому их только находим"""
+    return (
+        "UNWIND $rows AS row\n"
+        "MATCH (c:Car {title: toLower(row.title), url: row.url})\n"
+        f"MATCH {_pattern(var, label, properties)}\n"
+        f"MERGE (c)-[:{relationship}]->({var})"
+    )
+
+def car_frame(df: pd.DataFrame, params=PARAM_COLUMNS):
+    """Колонки параметров запроса для всех строк df"""
+    return pd.DataFrame({
+        param: df[column].astype(dtype) for param, (column, dtype) in params.items()
     })
 
-def import_cars_from_csv(filename: str):
-    print(f"📦 Импорт из файла {filename}...")
-    df = pd.read_csv(filename)
+def dimension_params(df: pd.DataFrame, properties):
+    """Различные значения одного измерения по всем строкам df"""
+    params = {param: PARAM_COLUMNS[param] for param in properties.values()}
+    columns = [column for column, _ in params.values()]
+    distinct = df[columns].drop_duplicates()
+    return car_frame(distinct, params).drop_duplicates().to_dict("records")
+
+def run_query(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+def write_batch(session, query, rows, batch_name):
+    """Пачка в своей транзакции: при сбое повторяется только она"""
+    for attempt in range(IMPORT_MAX_RETRIES + 1):
+        try:
+            session.execute_write(run_query, query, rows)
+            return
+        except (TransientError, ServiceUnavailable, SessionExpired) as e:
+            if attempt == IMPORT_MAX_RETRIES:
+                raise
+            print(f"⚠️ Пачка {batch_name}: {type(e).__name__}, повтор {attempt + 1}/{IMPORT_MAX_RETRIES}")
+            # Случайная добавка, чтобы воркеры не повторяли пачки одновременно
+            time.sleep(IMPORT_RETRY_DELAY * (attempt + 1) * random.uniform(0.5, 1.5))
+
+def import_dimensions(df: pd.DataFrame, driver, batch_size=IMPORT_BATCH_SIZE):
+    """Фаза 1: все различные узлы измерений в одной сессии, без конкуренции за блокировки"""
+    start = time.perf_counter()
+    total = 0
+    with driver.session() as session:
+        for _, label, properties, _ in DIMENSIONS:
+            rows = dimension_params(df, properties)
+            query = dimension_query(label, properties)
+            for offset in range(0, len(rows), batch_size):
+                write_batch(session, query, rows[offset:offset + batch_size], f"{label} {offset // batch_size + 1}")
+            total += len(rows)
+    print(f"🧩 Фаза 1: {total} узлов измерений за {time.perf_counter() - start:.2f} с")
+
+def import_partition(driver, frame: pd.DataFrame, query, name, batch_size, progress):
+    """Строки одного воркера в его собственной сессии"""
     with driver.session() as session:
-        for i, row in df.iterrows():
-            print(f"Добавляется автомобиль {i + 1}: {row['title']}")
-            session.execute_write(import_car, row)
+        for batch_num, offset in enumerate(range(0, len(frame), batch_size), start=1):
+            rows = frame.iloc[offset:offset + batch_size].to_dict("records")
+            write_batch(session, query, rows, f"{name}.{batch_num}")
+            progress(len(rows))
+
+def import_partitioned(driver, frame: pd.DataFrame, key, query, name, batch_size, workers):
+    """Параллельная запись frame: строки с одинаковым ключом key попадают к одному воркеру"""
+    start = time.perf_counter()
+    workers = max(1, min(workers, len(frame.drop_duplicates(subset=key)), (len(frame) + batch_size - 1) // batch_size))
+    partition = pd.util.hash_pandas_object(frame[key], index=False).to_numpy() % workers
+    lock = threading.Lock()
+    done = 0
+
+    def progress(rows):
+        nonlocal done
+        with lock:
+            done += rows
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {done}/{len(frame)} строк, {done / max(elapsed, 1e-9):.0f} строк/с")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(import_partition, driver, frame.loc[partition == worker], query,
+                            f"{name} {worker + 1}", batch_size, progress)
+            for worker in range(workers)
+        ]
+        for future in futures:
+            future.result()
+    return workers
+
+def import_cars(df: pd.DataFrame, driver, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_WORKERS):
+    """Импорт очищенных машин из DataFrame в три фазы, параллельно в workers сессиях.
+
+    Раздел между воркерами выбран так, чтобы два воркера никогда не писали
+    один и тот же узел:
+      1. узлы измерений — в одной сессии;
+      2. узлы Car — по хешу url;
+      3. связи — по одному измерению за раз, по хешу значения измерения.
+         У машины одно значение каждого измерения, поэтому и Car, и узел
+         измерения в каждой связи принадлежат ровно одному воркеру.
+    Ограничение: в фазе 3 воркеров не больше, чем различных значений измерения
+    (у Auction и Fuel их единицы), поэтому эти связи пишутся почти последовательно.
+    Взаимоблокировки исключены разделом, повтор в write_batch остаётся на случай сбоев.
+    """
+    missing_price = df["price_rub"].isna()
+    if missing_price.any():
+        # PriceRUB {value: null} не создать через MERGE
+        print(f"⚠️ Пропущено {int(missing_price.sum())} машин без цены")
+        df = df.loc[~missing_price]
+    if df.empty:
+        return
+
+    import_dimensions(df, driver, batch_size)
+
+    start = time.perf_counter()
+    cars = car_frame(df, {param: PARAM_COLUMNS[param] for param in CAR_PARAMS}).drop_duplicates()
+    used = import_partitioned(driver, cars, ["url"], CARS_QUERY, "Car", batch_size, workers)
+    print(f"🚗 Фаза 2: {len(cars)} машин в {used} сессиях за {time.perf_counter() - start:.2f} с")
+
+    start = time.perf_counter()
+    for var, label, properties, relationship in DIMENSIONS:
+        key = list(properties.values())
+        params = {param: PARAM_COLUMNS[param] for param in CAR_PARAMS + key}
+        links = car_frame(df, params).drop_duplicates()
+        used = import_partitioned(driver, links, key, relationship_query(var, label, properties, relationship),
+                                  relationship, batch_size, workers)
+        print(f"🔗 {relationship}: {len(links)} связей в {used} сессиях")
+    print(f"🔗 Фаза 3: связи за {time.perf_counter() - start:.2f} с")
+
+def import_cars_from_csv(filename: str, driver, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_WORKERS):
+    print(f"📦 Импорт из файла {filename}...")
+    raw = read_table(filename)
+    df = apply_schema(raw)
+    report_memory(raw, df, filename)
+    del raw
+    import_cars(df, driver, batch_size, workers)
     print(f"✅ Импорт из файла {filename} завершён!")
 
 if __name__ == "__main__":
-    # Опционально: принять флаг или имя файла из аргументов
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-    else:
-        # Если флаг (например, true/false) не передан, по умолчанию загрузим clean_new_cars.csv
-        filename = "clean_new_cars.csv"
-    import_cars_from_csv(filename)
-    driver.close()
+    arg_parser = argparse.ArgumentParser(description="Импорт очищенных машин в Neo4j")
+    # Если файл не передан, по умолчанию загрузим clean_new_cars.csv
+    arg_parser.add_argument("filename", nargs="?", default="clean_new_cars.csv")
+    arg_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    arg_parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    args = arg_parser.parse_args()
+    # graph_schema сам импортирует DIMENSIONS отсюда
+    from graph_schema import ensure_graph_schema
+
+    driver = create_driver()
+    try:
+        ensure_graph_schema(driver)
+        import_cars_from_csv(args.filename, driver, args.batch_size, args.workers)
+    finally:
+        driver.close()
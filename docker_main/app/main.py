@@ -2,6 +2,11 @@ import threading
 import subprocess
 import time
 import os
+import pandas as pd
+import car_store
+import eda
+import import_neo4j
+from graph_schema import ensure_graph_schema
 
 FLAG_FILE = "import_flag.txt"
 
@@ -19,16 +24,54 @@ def run_parser():
     except Exception as e:
         print(f"❌ Ошибка при запуске парсера: {e}")
 
-def run_eda(input_file):
-    print(f"🧼 Запуск eda.py для {input_file}...")
-    subprocess.run(["python3", "eda.py", input_file])
-
-def run_import(input_file):
-    print(f"📦 Импорт в Neo4j из {input_file}...")
-    subprocess.run(["python3", "import_neo4j.py", input_file])
+def get_driver():
+    """Драйвер Neo4j создаётся один раз и живёт всё время работы процесса"""
+    global neo4j_driver
+    if neo4j_driver is None:
+        driver = import_neo4j.create_driver()
+        try:
+            # Ограничения и индексы до первого MERGE, иначе каждый MERGE сканирует метку.
+            # Драйвер запоминается только после успеха, чтобы при ошибке схема проверялась снова
+            ensure_graph_schema(driver)
+        except Exception:
+            driver.close()
+            raise
+        neo4j_driver = driver
+    return neo4j_driver
+
+def run_full_import():
+    print("🚀 Первый импорт из cars.csv...")
+    # Хранилище выгружается в один файл только для разового полного импорта
+    car_store.export_csv("cars.csv")
+    try:
+        # Вся история: статистика пересчитывается с нуля, файл обрабатывается по частям
+        snapshot_file, stats = eda.clean_file("cars.csv", full=True, chunked=True)
+    finally:
+        os.remove("cars.csv")
+    if not os.path.exists(snapshot_file):
+        print(f"⚠️ Снимок {snapshot_file} не найден после eda. Пропускаем импорт.")
+        return False
+    import_neo4j.import_cars_from_csv(snapshot_file, get_driver())
+    # Статистика всей истории сохраняется только после успешного импорта
+    eda.save_stats(stats)
+    return True
+
+def import_new_cars(input_file):
+    """Пачка новых машин: очистка и импорт в памяти, без промежуточных файлов"""
+    start = time.perf_counter()
+    try:
+        raw = pd.read_csv(input_file)
+    except pd.errors.EmptyDataError:
+        print(f"Файл {input_file} пуст, импортировать нечего.")
+        return
+    df, stats = eda.clean_batch(raw)
+    import_neo4j.import_cars(df, get_driver())
+    # Пачка попадает в статистику, только если машины дошли до графа
+    eda.save_stats(stats)
+    print(f"⏱️ Пачка из {len(df)} машин очищена и импортирована за {time.perf_counter() - start:.2f} с")
 
 def remove_temp_files():
-    for file in ["new_cars.csv", "clean_new_cars.csv"]:
+    for file in ["new_cars.csv"]:
         if os.path.exists(file):
             os.remove(file)
             print(f"🗑️ Удалён файл: {file}")
@@ -59,33 +102,32 @@ print("📡 Наблюдение за new_cars.csv запущено...")
 
 was_processed = False
 first_full_import_done = read_flag()
+neo4j_driver = None
 
 while True:
     if os.path.exists("new_cars.csv") and not was_processed:
         print("📥 Обнаружен файл new_cars.csv. Обработка...")
 
         # === Одноразовый импорт всех машин из cars.csv ===
-        if not first_full_import_done and os.path.exists("cars.csv"):
-            print("🚀 Первый импорт из cars.csv...")
-            run_eda("cars.csv")
-            if os.path.exists("clean_cars.csv"):
-                run_import("clean_cars.csv")
-                write_flag(True)
-                first_full_import_done = True
-            else:
-                print("⚠️ Файл clean_cars.csv не найден после eda. Пропускаем импорт.")
+        # Пока есть контрольная точка, полный парсинг не завершён и хранилище неполное
+        if not first_full_import_done and car_store.exists() and not os.path.exists("crawl_checkpoint.json"):
+            try:
+                if run_full_import():
+                    write_flag(True)
+                    first_full_import_done = True
+            except Exception as e:
+                # Флаг остаётся False: полный импорт повторится при следующем new_cars.csv
+                print(f"⚠️ Ошибка полного импорта: {e}. Повторим в следующем цикле.")
 
         # === Импорт новых машин ===
-        run_eda("new_cars.csv")
-
-        if os.path.exists("clean_new_cars.csv"):
-            run_import("clean_new_cars.csv")
+        try:
+            import_new_cars("new_cars.csv")
             remove_temp_files()
             was_processed = True
             print("✅ Импорт завершён и временные файлы удалены.")
-        else:
+        except Exception as e:
             remove_temp_files()
-            print("⚠️ Файл clean_new_cars.csv не найден после eda. Пропускаем импорт.")
+            print(f"⚠️ Ошибка обработки new_cars.csv: {e}. Пропускаем импорт.")
 
     # Если new_cars.csv недавно обновился → сбрасываем флаг
     if os.path.exists("new_cars.csv"):
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === Настройки экспорта метрик парсера ===
+METRICS_FILE = os.getenv("METRICS_FILE", "crawl_metrics.json")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+# 0 — HTTP-эндпоинт не поднимается, метрики только в файле
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Границы корзин гистограмм времени этапов, в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(BUCKETS) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "buckets": buckets,
+        }
+
+class CrawlMetrics:
+    """Метрики парсера: гистограммы этапов, счётчики страниц/машин, ошибки и трафик.
+
+    Обновляется из потока событийного цикла загрузчика и из рабочих потоков,
+    поэтому все изменения идут под блокировкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {}
+            self.counters = {"pages": 0, "cars": 0, "bytes_downloaded": 0, "requests": 0}
+            self.errors = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def error(self, stage, error_type):
+        key = f"{stage}:{error_type}"
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            return {
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "elapsed_sec": round(elapsed, 3),
+                "counters": dict(self.counters),
+                "pages_per_sec": round(self.counters["pages"] / elapsed, 4),
+                "cars_per_sec": round(self.counters["cars"] / elapsed, 4),
+                "fetch_errors": dict(self.errors),
+                "stages": {stage: histogram.to_dict() for stage, histogram in self.stages.items()},
+            }
+
+    def to_prometheus(self):
+        data = self.snapshot()
+        lines = []
+        for name, value in data["counters"].items():
+            lines.append(f"crawler_{name}_total {value}")
+        lines.append(f"crawler_pages_per_second {data['pages_per_sec']}")
+        lines.append(f"crawler_cars_per_second {data['cars_per_sec']}")
+        for key, value in data["fetch_errors"].items():
+            stage, error_type = key.split(":", 1)
+            lines.append(f'crawler_fetch_errors_total{{stage="{stage}",type="{error_type}"}} {value}')
+        for stage, histogram in data["stages"].items():
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=METRICS_FILE):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+metrics = CrawlMetrics()
+
+def _make_handler(collector):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = collector.to_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(collector.snapshot(), ensure_ascii=False), "application/json"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+def start_exporter(collector=metrics, path=METRICS_FILE, interval=METRICS_INTERVAL, port=METRICS_PORT):
+    """Фоновая запись метрик в файл и, если задан порт, HTTP-эндпоинт /metrics"""
+    def write_loop():
+        while True:
+            try:
+                collector.write_file(path)
+            except Exception as e:
+                print(f"Ошибка записи метрик: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=write_loop, daemon=True).start()
+    if port:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _make_handler(collector))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"📈 Метрики парсера: http://localhost:{port}/metrics")
@@ -1,22 +1,48 @@
+import asyncio
 import csv
+import json
 import os
 import re
 import concurrent.futures
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import time
 from datetime import datetime
+from fetcher import AsyncFetcher
+from metrics import metrics, start_exporter
+import car_store
+import url_index
+import dead_letter
+import html_archive
+from scheduler import PollScheduler
 
+# Старый единый файл; при первом запуске переносится в car_store
 CSV_FILE = "cars.csv"
+# Адрес сайта; для бенчмарков можно направить на локальный replay_server.py
+SITE_URL = os.getenv("SITE_URL", "https://mado.group").rstrip("/")
 NEW_CARS_FILE = "new_cars.csv"
+# Предел глубины проверки новых объявлений: дальше идём, только пока все карточки страницы новые
+CHECK_MAX_PAGES = int(os.getenv("CHECK_MAX_PAGES", "20"))
+# Последняя полностью записанная страница полного парсинга
+CHECKPOINT_FILE = "crawl_checkpoint.json"
+# Сколько страниц списка может быть в работе одновременно при полном парсинге (1 — без опережения)
+LISTING_PREFETCH = int(os.getenv("LISTING_PREFETCH", "3"))
+# Разбор HTML: "process" — пул процессов, "thread" — пул потоков
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", "8"))
+# html.parser даёт вывод, совпадающий со старым; "lxml" быстрее, но проверяйте на корпусе (benchmark.py parse)
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
 
-def save_row(fieldnames, row, first_write=False):
-    mode = "w" if first_write else "a"
-    with open(CSV_FILE, mode, newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if first_write:
-            writer.writeheader()
-        writer.writerow(row)
+_parse_executor = None
+
+def has_class(*names):
+    """Проверка class для SoupStrainer: хотя бы один из классов элемента входит в names"""
+    names = set(names)
+    return lambda class_value: bool(class_value) and not names.isdisjoint(class_value.split())
+
+# Строим DOM только для узлов, которые реально читает парсер
+LISTING_STRAINER = SoupStrainer("div", class_=has_class("statistic_items_list"))
+DETAIL_STRAINER = SoupStrainer("div", class_=has_class("v", "params_table", "detail_auc__table"))
 
 def save_new_cars_to_file(fieldnames, new_cars):
     """Сохраняет новые машины в отдельный файл, перезаписывая его"""
@@ -33,398 +59,528 @@ def save_new_cars_to_file(fieldnames, new_cars):
         for row in new_cars:
             writer.writerow(row)
 
-def prepend_new_cars_to_main_csv(fieldnames, new_cars):
-    """Добавляет новые машины в начало основного CSV файла"""
-    if not new_cars:
-        return
-    
-    # Читаем существующие данные
-    existing_data = []
-    if os.path.exists(CSV_FILE):
-        try:
-            with open(CSV_FILE, "r", newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                existing_data = list(reader)
-        except Exception as e:
-            print(f"Ошибка при чтении существующего файла: {e}")
-    
-    # Записываем новые данные в начало файла
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        # Сначала записываем новые машины
-        for row in new_cars:
-            writer.writerow(row)
-        
-        # Затем записываем существующие данные
-        for row in existing_data:
-            writer.writerow(row)
+def get_listing_url(page_num):
+    return f"{SITE_URL}/statistic-china/?PAGE={page_num}"
 
-def get_existing_car_urls():
-    """Получает URL первых 100 машин из CSV для проверки новых объявлений"""
-    if not os.path.exists(CSV_FILE):
-        return set()
-    
-    urls = set()
-    try:
-        with open(CSV_FILE, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for i, row in enumerate(reader):
-                if i >= 100:  # Проверяем первые 100 записей
-                    break
-                if 'url' in row:
-                    urls.add(row['url'])
-    except Exception as e:
-        print(f"Ошибка при чтении существующих URL: {e}")
-    
-    return urls
+def parse_listing_html(html):
+    """Возвращает ссылки на машины со страницы списка или None, если карточек нет"""
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=LISTING_STRAINER)
+    cards = soup.select("div.statistic_items_list")
+    if not cards:
+        return None
+
+    car_links = []
+    for card in cards:
+        links = card.select("a.name")
+        for link_element in links:
+            href = link_element.get("href")
+            title = link_element.get_text(strip=True)
+            if href:
+                car_links.append({
+                    "title": title,
+                    "url": f"{SITE_URL}{href}",
+                    "relative_url": href
+                })
+    return car_links
+
+def build_car_row(car):
+    parsed_info = parse_car_info(car["brief_info"], car["detailed_specs"])
+    return {
+        "title": clean_car_title(car["title"]),
+        "url": car["url"],
+        "price_rub": car["price_rub"],
+        "year": parsed_info["year"],
+        "mileage": parsed_info["mileage"],
+        "transmission": parsed_info["transmission"],
+        "color": parsed_info["color"],
+        "drive_type": parsed_info["drive_type"],
+        "fuel_type": parsed_info["fuel_type"],
+        "power": parsed_info["power"],
+        "auction": parsed_info["auction"],
+        "china_price": parsed_info["china_price"],
+        "engine_volume": parsed_info["engine_volume"],
+        "body_type": parsed_info["body_type"],
+        "environmental_standards": parsed_info["environmental_standards"],
+        "engine": parsed_info["engine"],
+        "gear_count": parsed_info["gear_count"]
+    }
+
+CAR_FIELDNAMES = sorted([
+    "title", "url", "price_rub", "year", "mileage", "transmission", "color", "drive_type",
+    "fuel_type", "power", "auction", "china_price", "engine_volume", "body_type",
+    "environmental_standards", "engine", "gear_count"
+])
+
+def build_car_rows(html_data):
+    """Разбор загруженных страниц и извлечение полей с замером времени этапов.
 
-def check_for_new_cars():
-    """Проверяет первые 3 страницы на наличие новых объявлений"""
-    existing_urls = get_existing_car_urls()
+    Незагруженные страницы не превращаются в строки с "Ошибка загрузки",
+    а уходят в очередь ошибок и повторяются в следующем цикле.
+    """
+    failed = [item for item in html_data if not is_fetched(item)]
+    html_data = [item for item in html_data if is_fetched(item)]
+    if failed:
+        metrics.inc("dead_lettered", len(failed))
+        dead_letter.add(failed)
+    dead_letter.remove(item["url"] for item in html_data)
+    # Сырой HTML сохраняем, чтобы после исправлений парсера пересобрать данные без сети
+    with metrics.timer("archive_write"):
+        html_archive.append(html_data)
+
+    with metrics.timer("parse_html"):
+        detailed_cars = parse_cars_html(html_data)
+    with metrics.timer("extract_fields"):
+        rows = [build_car_row(car) for car in detailed_cars]
+    metrics.inc("cars", len(rows))
+    return rows
+
+def check_for_new_cars(fetcher, max_pages=CHECK_MAX_PAGES):
+    """Проверяет начало списка на наличие новых объявлений.
+
+    Список отсортирован от новых к старым, поэтому проверка начинается
+    со страницы 1 и идёт глубже, только пока все карточки страницы новые.
+    Первая страница с уже известным URL завершает проверку.
+    Возвращает (строки новых машин, включая повторы из очереди ошибок;
+    число новых URL на страницах списка — только оно идёт в PollScheduler).
+    """
     new_cars = []
+    listed_count = 0
+    # Ссылки из очереди ошибок могут снова попасться на первых страницах: это не новые объявления
+    retry_urls = {car["url"] for car in dead_letter.pending_links()}
+    # Одно объявление может попасть на две страницы, если список сдвинулся во время проверки
+    seen_in_cycle = set()
     
-    print(f"Проверяем новые объявления среди первых {len(existing_urls)} существующих...")
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-    }
+    print(f"Проверяем новые объявления (известно URL: {url_index.count()})...")
     
-    for page_num in range(1, 4):  # Проверяем первые 3 страницы
+    for page_num in range(1, max_pages + 1):
         print(f"Проверяем страницу {page_num}...")
-        url = f"https://mado.group/statistic-china/?PAGE={page_num}"
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            page_links = parse_listing_html(fetcher.get_html(get_listing_url(page_num)))
         except Exception as e:
             print(f"Ошибка загрузки страницы {page_num}: {e}")
-            continue
+            break
 
-        # Ищем карточки товаров
-        cards = soup.select("div.statistic_items_list")
-        if not cards:
+        if page_links is None:
             print(f"Страница {page_num}: карточки не найдены")
-            continue
+            break
 
+        unseen_urls = url_index.filter_unseen(car["url"] for car in page_links)
         car_links = []
-        for card in cards:
-            links = card.select("a.name")
-            for link_element in links:
-                href = link_element.get("href")
-                title = link_element.get_text(strip=True)
-                if href:
-                    full_url = f"https://mado.group{href}"
-                    if full_url not in existing_urls:
-                        car_links.append({
-                            "title": title,
-                            "url": full_url,
-                            "relative_url": href
-                        })
+        for car in page_links:
+            if car["url"] in unseen_urls and car["url"] not in seen_in_cycle:
+                seen_in_cycle.add(car["url"])
+                car_links.append(car)
 
         print(f"Страница {page_num}: найдено {len(car_links)} новых объявлений")
+        listed_count += sum(1 for car in car_links if car["url"] not in retry_urls)
 
         if car_links:
-            detailed_cars = get_cars_details_parallel_requests(car_links)
-            print(f"Страница {page_num}: обработано {len(detailed_cars)} объявлений")
-            
-            for car in detailed_cars:
-                parsed_info = parse_car_info(car["brief_info"], car["detailed_specs"])
-                
-                row = {
-                    "title": clean_car_title(car["title"]),
-                    "url": car["url"],
-                    "price_rub": car["price_rub"],
-                    "year": parsed_info["year"],
-                    "mileage": parsed_info["mileage"],
-                    "transmission": parsed_info["transmission"],
-                    "color": parsed_info["color"],
-                    "drive_type": parsed_info["drive_type"],
-                    "fuel_type": parsed_info["fuel_type"],
-                    "power": parsed_info["power"],
-                    "auction": parsed_info["auction"],
-                    "china_price": parsed_info["china_price"],
-                    "engine_volume": parsed_info["engine_volume"],
-                    "body_type": parsed_info["body_type"],
-                    "environmental_standards": parsed_info["environmental_standards"],
-                    "engine": parsed_info["engine"],
-                    "gear_count": parsed_info["gear_count"]
-                }
-                new_cars.append(row)
-    
-    return new_cars
+            page_cars = build_car_rows(fetcher.get_cars_html(car_links))
+            print(f"Страница {page_num}: обработано {len(page_cars)} объявлений")
+            new_cars.extend(page_cars)
+        metrics.inc("pages")
 
-def parse_all_pages(max_pages=None, new_cars_buffer=None):
-    first_write = not os.path.exists(CSV_FILE)
-    seen_fields = set()
-    page_num = 1
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-    }
-    
-    # Список для накопления новых машин перед записью
-    if new_cars_buffer is None:
-        new_cars_buffer = []
-
-    while True:
-        if max_pages and page_num > max_pages:
-            break
-        url = f"https://mado.group/statistic-china/?PAGE={page_num}"
-        
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-        except Exception as e:
-            print(f"Ошибка загрузки страницы {page_num}: {e}")
+        if any(car["url"] not in unseen_urls for car in page_links):
+            # Дальше по списку только уже известные объявления
             break
+    else:
+        print(f"Все карточки на {max_pages} страницах новые, остальные проверим в следующем цикле")
 
-        cards = soup.select("div.statistic_items_list")
-        if not cards:
-            break
+    # Повторяем ссылки, которые не удалось загрузить в прошлых циклах
+    retry_links = dead_letter.pending_links()
+    unseen_urls = url_index.filter_unseen(car["url"] for car in retry_links)
+    dead_letter.remove(car["url"] for car in retry_links if car["url"] not in unseen_urls)
+    retry_links = [car for car in retry_links if car["url"] in unseen_urls and car["url"] not in seen_in_cycle]
+    if retry_links:
+        page_cars = build_car_rows(fetcher.get_cars_html(retry_links))
+        print(f"Очередь ошибок: повторено {len(retry_links)}, загружено {len(page_cars)}")
+        new_cars.extend(page_cars)
+    
+    return new_cars, listed_count
 
-        car_links = []
-        for card in cards:
-            links = card.select("a.name")
-            for link_element in links:
-                href = link_element.get("href")
-                title = link_element.get_text(strip=True)
-                if href:
-                    full_url = f"https://mado.group{href}"
-                    car_links.append({
-                        "title": title,
-                        "url": full_url,
-                        "relative_url": href
-                    })
-
-        if not car_links:
-            break
+async def crawl_listing_pages(fetcher, handle_page, max_pages=None, prefetch=LISTING_PREFETCH, filter_links=None, start_page=1):
+    """Конвейерный обход страниц списка.
 
-        if car_links:
-            detailed_cars = get_cars_details_parallel_requests(car_links)
-            
-            print(f"Страница {page_num}: {len(car_links)} найдено, {len(detailed_cars)} обработано")
-            
-            page_cars = []
-            for car in detailed_cars:
-                parsed_info = parse_car_info(car["brief_info"], car["detailed_specs"])
-                
-                row = {
-                    "title": clean_car_title(car["title"]),
-                    "url": car["url"],
-                    "price_rub": car["price_rub"],
-                    "year": parsed_info["year"],
-                    "mileage": parsed_info["mileage"],
-                    "transmission": parsed_info["transmission"],
-                    "color": parsed_info["color"],
-                    "drive_type": parsed_info["drive_type"],
-                    "fuel_type": parsed_info["fuel_type"],
-                    "power": parsed_info["power"],
-                    "auction": parsed_info["auction"],
-                    "china_price": parsed_info["china_price"],
-                    "engine_volume": parsed_info["engine_volume"],
-                    "body_type": parsed_info["body_type"],
-                    "environmental_standards": parsed_info["environmental_standards"],
-                    "engine": parsed_info["engine"],
-                    "gear_count": parsed_info["gear_count"]
+    Страницы списка загружаются с опережением (не более prefetch страниц
+    одновременно в работе), ссылки на машины попадают в общую очередь,
+    из которой воркеры загружают страницы машин. handle_page(page_num,
+    car_links, html_data) вызывается строго по порядку страниц в отдельном
+    потоке, чтобы разбор и запись не останавливали загрузку. Обход
+    заканчивается на первой странице без карточек или с ошибкой загрузки.
+    filter_links(car_links) позволяет отбросить ссылки до загрузки страниц машин.
+    Возвращает False, если обход прерван ошибкой загрузки или обработки страницы списка.
+
+    Память ограничена независимо от числа страниц: очередь ссылок ограничена,
+    а окно prefetch освобождается только после handle_page, поэтому медленная
+    запись притормаживает загрузку, и в памяти не больше prefetch страниц.
+    """
+    detail_queue = asyncio.Queue(maxsize=fetcher.concurrency * 2)
+    window = asyncio.Semaphore(prefetch)
+    pages = {}
+    page_ready = {}
+    finished = True
+
+    def get_page_ready(page_num):
+        if page_num not in page_ready:
+            page_ready[page_num] = asyncio.get_running_loop().create_future()
+        return page_ready[page_num]
+
+    async def listing_producer():
+        nonlocal finished
+        page_num = start_page
+        try:
+            while not (max_pages and page_num > max_pages):
+                await window.acquire()
+                try:
+                    car_links = parse_listing_html(await fetcher.fetch_text(get_listing_url(page_num)))
+                except Exception as e:
+                    print(f"Ошибка загрузки страницы {page_num}: {e}")
+                    finished = False
+                    car_links = None
+                if not car_links:
+                    break
+                if filter_links:
+                    car_links = await asyncio.to_thread(filter_links, car_links)
+
+                page = {
+                    "car_links": car_links,
+                    "html_data": [None] * len(car_links),
+                    "remaining": len(car_links),
+                    "done": asyncio.Event(),
                 }
-                page_cars.append(row)
+                pages[page_num] = page
+                for index, car in enumerate(car_links):
+                    await detail_queue.put((page_num, index, car))
+                if not car_links:
+                    page["done"].set()
+                get_page_ready(page_num).set_result(page)
+                page_num += 1
+        except Exception as e:
+            # Например, ошибка SQLite в filter_links: обход прерывается как при ошибке загрузки,
+            # контрольная точка остаётся, и следующий цикл продолжит с этой страницы
+            print(f"Ошибка обработки страницы {page_num}: {e}")
+            finished = False
+        finally:
+            # Сигнал писателю: дальше страниц нет. Без него писатель ждал бы эту страницу вечно
+            ready = get_page_ready(page_num)
+            if not ready.done():
+                ready.set_result(None)
 
-            # Добавляем машины в начало буфера (чтобы сохранить порядок как на сайте)
-            new_cars_buffer = page_cars + new_cars_buffer
-            
-            # Определяем все поля
-            for car in page_cars:
-                seen_fields.update(car.keys())
-
-            # Записываем данные в основной файл при первом запуске
-            if first_write:
-                all_keys = sorted(seen_fields)
-                for car in page_cars:
-                    save_row(all_keys, car, first_write=first_write)
-                    first_write = False
-            else:
-                # Для последующих страниц записываем без заголовка
-                all_keys = sorted(seen_fields)
-                for car in page_cars:
-                    save_row(all_keys, car, first_write=False)
-        
-        page_num += 1
-    
-    return new_cars_buffer, seen_fields
+    async def detail_worker():
+        while True:
+            page_num, index, car = await detail_queue.get()
+            page = pages[page_num]
+            page["html_data"][index] = await fetcher.fetch_car(car)
+            page["remaining"] -= 1
+            if page["remaining"] == 0:
+                page["done"].set()
 
-def fetch_car_html(car_info):
+    producer = asyncio.create_task(listing_producer())
+    workers = [asyncio.create_task(detail_worker()) for _ in range(fetcher.concurrency)]
     try:
-        url = car_info["url"]
-        title = car_info["title"]
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        return {
-            "url": url,
-            "title": title,
-            "html": response.text,
-            "status": "success"
-        }
-        
-    except Exception as e:
-        title = car_info.get("title", "Неизвестно")
-        return {
-            "url": car_info["url"],
-            "title": title,
-            "html": None,
-            "status": "error",
-            "error": str(e)
-        }
-
-def parse_car_html_from_requests(html_data_item):
+        page_num = start_page
+        while True:
+            page = await get_page_ready(page_num)
+            del page_ready[page_num]
+            if page is None:
+                break
+            await page["done"].wait()
+            await asyncio.to_thread(handle_page, page_num, page["car_links"], page["html_data"])
+            del pages[page_num]
+            window.release()
+            page_num += 1
+    finally:
+        for task in [producer] + workers:
+            task.cancel()
+        await asyncio.gather(producer, *workers, return_exceptions=True)
+    return finished
+
+def load_checkpoint():
+    """Контрольная точка незавершённого полного парсинга или None"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
     try:
-        car_url = html_data_item["url"]
-        car_title = html_data_item["title"]
-        html_content = html_data_item["html"]
-        
-        if not html_content or html_data_item["status"] != "success":
-            return {
-                "url": car_url,
-                "title": car_title,
-                "price_rub": "Ошибка загрузки",
-                "brief_info": "Ошибка загрузки",
-                "detailed_specs": "Ошибка загрузки"
-            }
-        
-        soup = BeautifulSoup(html_content, 'html.parser')
-        details = {"url": car_url, "title": car_title}
-        
-        try:
-            price_element = soup.select_one("div.v")
-            if price_element:
-                details["price_rub"] = price_element.get_text(strip=True)
-            else:
-                details["price_rub"] = "Не найдено"
-        except:
-            details["price_rub"] = "Ошибка парсинга"
-        
-        try:
-            brief_info_element = soup.select_one("div.params_table")
-            if brief_info_element:
-                details["brief_info"] = brief_info_element.get_text(strip=True)
-            else:
-                details["brief_info"] = "Не найдено"
-        except:
-            details["brief_info"] = "Ошибка парсинга"
-        
-        try:
-            detailed_specs_element = soup.select_one("div.detail_auc__table.table.table_2")
-            if detailed_specs_element:
-                details["detailed_specs"] = detailed_specs_element.get_text(strip=True)
-            else:
-                details["detailed_specs"] = "Не найдено"
-        except:
-            details["detailed_specs"] = "Ошибка парсинга"
-        
-        return details
-        
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
     except Exception as e:
-        return {
-            "url": html_data_item["url"],
-            "title": html_data_item["title"],
-            "price_rub": "Ошибка",
-            "brief_info": "Ошибка",
-            "detailed_specs": "Ошибка"
-        }
-
-def get_cars_details_parallel_requests(car_links):
-    max_workers_fetch = min(24, len(car_links))
-    html_data = []
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_fetch) as executor:
-        futures = [executor.submit(fetch_car_html, car) for car in car_links]
+        print(f"Ошибка чтения контрольной точки: {e}")
+        return None
+
+def save_checkpoint(last_page, rows):
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "last_page": last_page,
+            "rows": rows,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }, f)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+def parse_all_pages(fetcher, max_pages=None):
+    """Полный парсинг с контрольной точкой после каждой записанной страницы.
+
+    Строки страниц сразу уходят в хранилище и в памяти не накапливаются.
+    Если есть контрольная точка прерванного парсинга, обход продолжается
+    со следующей за ней страницы. Контрольная точка удаляется, только
+    когда обход дошёл до конца списка. Возвращает число записанных машин.
+    """
+    checkpoint = load_checkpoint()
+    if checkpoint:
+        start_page = checkpoint["last_page"] + 1
+        print(f"Продолжаем полный парсинг со страницы {start_page} (записано {checkpoint['rows']} машин)")
+        if car_store.total_rows() != checkpoint["rows"]:
+            # Падение между записью страницы и контрольной точкой: индекс URL мог отстать
+            url_index.build_from_store()
+    else:
+        start_page = 1
+        save_checkpoint(0, car_store.total_rows())
+
+    writer = car_store.TailWriter(CAR_FIELDNAMES)
+    written_rows = 0
+
+    def commit_pages(pages):
+        # Контрольная точка и индекс обновляются только для страниц, записанных на диск
+        nonlocal written_rows
+        if not pages:
+            return
+        url_index.add_urls(car["url"] for _, rows in pages for car in rows)
+        written_rows += sum(len(rows) for _, rows in pages)
+        save_checkpoint(pages[-1][0], writer.total_rows())
+
+    def handle_page(page_num, car_links, html_data):
+        page_cars = build_car_rows(html_data)
         
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                result = future.result()
-                html_data.append(result)
-            except Exception as e:
-                pass
-    
-    max_workers_parse = min(24, len(html_data))
-    results = []
+        print(f"Страница {page_num}: {len(car_links)} найдено, {len(page_cars)} обработано")
+
+        # Страницы идут от новых машин к старым, поэтому дописываем в хвост хранилища
+        with metrics.timer("store_write"):
+            commit_pages(writer.add_page(page_num, page_cars))
+        metrics.inc("pages")
+
+    def skip_known(car_links):
+        # Страницы машин, уже сохранённых ранее, повторно не загружаем
+        unseen_urls = url_index.filter_unseen(car["url"] for car in car_links)
+        return [car for car in car_links if car["url"] in unseen_urls]
+
+    try:
+        finished = fetcher.run(crawl_listing_pages(
+            fetcher, handle_page, max_pages=max_pages, filter_links=skip_known, start_page=start_page
+        ))
+    finally:
+        commit_pages(writer.close())
+    if finished:
+        clear_checkpoint()
+    else:
+        print("Полный парсинг прерван, продолжим с контрольной точки в следующем цикле")
+    
+    return written_rows
+
+def extract_car_fields(html_content):
+    """Извлекает из HTML страницы машины тройку (price_rub, brief_info, detailed_specs)"""
+    soup = BeautifulSoup(html_content, HTML_PARSER, parse_only=DETAIL_STRAINER)
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_parse) as executor:
-        futures = [executor.submit(parse_car_html_from_requests, html_item) for html_item in html_data]
-        
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as e:
-                pass
+    try:
+        price_element = soup.select_one("div.v")
+        if price_element:
+            price_rub = price_element.get_text(strip=True)
+        else:
+            price_rub = "Не найдено"
+    except:
+        price_rub = "Ошибка парсинга"
     
-    return results
+    try:
+        brief_info_element = soup.select_one("div.params_table")
+        if brief_info_element:
+            brief_info = brief_info_element.get_text(strip=True)
+        else:
+            brief_info = "Не найдено"
+    except:
+        brief_info = "Ошибка парсинга"
     
+    try:
+        detailed_specs_element = soup.select_one("div.detail_auc__table.table.table_2")
+        if detailed_specs_element:
+            detailed_specs = detailed_specs_element.get_text(strip=True)
+        else:
+            detailed_specs = "Не найдено"
+    except:
+        detailed_specs = "Ошибка парсинга"
+    
+    return price_rub, brief_info, detailed_specs
+
+def extract_car_fields_batch(html_batch):
+    """Разбирает пачку страниц целиком внутри одного воркера"""
+    results = []
+    for html_content in html_batch:
+        try:
+            results.append(extract_car_fields(html_content))
+        except Exception:
+            results.append(("Ошибка", "Ошибка", "Ошибка"))
+    return results
+
+def make_car_details(html_data_item, fields):
+    price_rub, brief_info, detailed_specs = fields
+    return {
+        "url": html_data_item["url"],
+        "title": html_data_item["title"],
+        "price_rub": price_rub,
+        "brief_info": brief_info,
+        "detailed_specs": detailed_specs
+    }
+
+def is_fetched(html_data_item):
+    return bool(html_data_item["html"]) and html_data_item["status"] == "success"
+
+def get_parse_executor():
+    """Пул для разбора HTML, создаётся один раз на процесс"""
+    global _parse_executor
+    if _parse_executor is None:
+        if PARSE_EXECUTOR == "process":
+            # html.parser написан на чистом Python, в потоках его сериализует GIL
+            _parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        else:
+            _parse_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_executor
+
+def shutdown_parse_executor():
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown()
+        _parse_executor = None
+
+def parse_cars_html(html_data):
+    """Этап разбора: HTML загруженных страниц -> словари с price_rub/brief_info/detailed_specs"""
+    if not html_data:
+        return []
+
+    fetched = [item for item in html_data if is_fetched(item)]
+    # В воркеры уходит только HTML пачками, чтобы накладные расходы на pickle были малы
+    batches = [
+        [item["html"] for item in fetched[i:i + PARSE_BATCH_SIZE]]
+        for i in range(0, len(fetched), PARSE_BATCH_SIZE)
+    ]
+    parsed = {}
+    if batches:
+        batch_results = get_parse_executor().map(extract_car_fields_batch, batches)
+        for item, fields in zip(fetched, (f for batch in batch_results for f in batch)):
+            parsed[id(item)] = fields
+
+    results = []
+    for item in html_data:
+        fields = parsed.get(id(item), ("Ошибка загрузки",) * 3)
+        results.append(make_car_details(item, fields))
+    return results
+
+# === Извлечение полей ===
+# Все регулярные выражения компилируются один раз при импорте модуля
+STOP_FIELDS = [
+    "Год", "Пробег", "КПП", "Цвет", "Привод", "Тип топлива", "Мощность", 
+    "Аукцион", "Номер лота", "Цена в Китае", "Объем", "Кузов тип", 
+    "Стандарты защиты окружающей среды", "Модель двигателя", "Смещение", "Количество передач", 
+    "Максимальная скорость", "Объем топливного бака", "Информация о номерном знаке"
+]
+BRIEF_FIELDS = {
+    "year": "Год",
+    "mileage": "Пробег",
+    "transmission": "КПП",
+    "color": "Цвет",
+    "drive_type": "Привод",
+    "fuel_type": "Тип топлива",
+    "power": "Мощность",
+    "auction": "Аукцион",
+    "china_price": "Цена в Китае",
+    "engine_volume": "Объем",
+}
+SPECS_FIELDS = {
+    "body_type": "Кузов тип",
+    "environmental_standards": "Стандарты защиты окружающей среды",
+    "engine": "Модель двигателя",
+    "gear_count": "Количество передач",
+}
+
+STOP_PATTERNS = {name: re.compile(re.escape(name), re.IGNORECASE) for name in STOP_FIELDS}
+_field_patterns = {}
 
+def get_field_pattern(field_name):
+    pattern = _field_patterns.get(field_name)
+    if pattern is None:
+        pattern = re.compile(rf"{re.escape(field_name)}\s*:?\s*([^\n\r]+)", re.IGNORECASE | re.MULTILINE)
+        _field_patterns[field_name] = pattern
+    return pattern
+
+LEADING_SEPARATORS_RE = re.compile(r'^[::\s]+')
+EDGE_SEPARATORS_RE = re.compile(r'^[::\s]+|[::\s]+$')
+COLOR_RE = re.compile(r"(\w+)")
+YEAR_RE = re.compile(r"(\d{4})")
+MILEAGE_RE = re.compile(r"(\d+\s*км)")
+POWER_RE = re.compile(r"(\d+\s*л\.с\.)")
+VOLUME_RE = re.compile(r"(\d+\s*см3|\d+[\.,]\d*\s*L)")
+CHINA_PRICE_RE = re.compile(r"(\d+[\s\d,]*\s*¥)")
+EURO_RE = re.compile(r"(Euro\s*[IVX\d\s]+)", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+GEAR_RE = re.compile(r"(\d+)")
+BODY_RES = [
+    re.compile(pattern, re.IGNORECASE) for pattern in [
+        r"седан", r"хэтчбек", r"универсал", r"внедорожник", r"кроссовер", 
+        r"купе", r"кабриолет", r"минивэн", r"пикап", r"лифтбек", r"mpv"
+    ]
+]
+ENGINE_MODEL_RE = re.compile(r"(.+?)(?:Смещение|$)", re.IGNORECASE)
 
-def extract_field_value(text, field_name):
+def index_stop_fields(text):
+    """Один проход по тексту на метку: позиции всех вхождений каждой метки-границы.
+
+    Метки не перекрываются сами с собой, поэтому первое вхождение внутри
+    найденной строки поля — это первая позиция из списка не левее её начала.
+    """
+    return {name: [m.span() for m in pattern.finditer(text)] for name, pattern in STOP_PATTERNS.items()}
+
+def extract_field_value(text, field_name, stop_index=None):
     if not text or text == "Не найдено" or text == "Ошибка парсинга":
         return "Не найдено"
     
-    stop_fields = [
-        "Год", "Пробег", "КПП", "Цвет", "Привод", "Тип топлива", "Мощность", 
-        "Аукцион", "Номер лота", "Цена в Китае", "Объем", "Кузов тип", 
-        "Стандарты защиты окружающей среды", "Модель двигателя", "Смещение", "Количество передач", 
-        "Максимальная скорость", "Объем топливного бака", "Информация о номерном знаке"
-    ]
-    
-    field_pattern = rf"{re.escape(field_name)}\s*:?\s*([^\n\r]+)"
-    match = re.search(field_pattern, text, re.IGNORECASE | re.MULTILINE)
+    match = get_field_pattern(field_name).search(text)
     
     if not match:
         return "Не найдено"
     
-    found_line = match.group(1).strip()
-    found_line = re.sub(r'^[::\s]+', '', found_line)
-    
-    for stop_field in stop_fields:
-        if stop_field != field_name:
-            stop_pattern = rf"({re.escape(stop_field)})"
-            stop_match = re.search(stop_pattern, found_line, re.IGNORECASE)
-            if stop_match:
-                found_line = found_line[:stop_match.start()].strip()
-                break
+    raw_line = match.group(1)
+    found_line = raw_line.strip()
+    line_start = match.start(1) + len(raw_line) - len(raw_line.lstrip())
+    stripped_line = LEADING_SEPARATORS_RE.sub('', found_line)
+    line_start += len(found_line) - len(stripped_line)
+    found_line = stripped_line
+    line_end = line_start + len(found_line)
+    
+    # Обрезаем по первой (в порядке STOP_FIELDS) метке, встречающейся в строке
+    if stop_index is None:
+        stop_index = index_stop_fields(text)
+    for stop_field in STOP_FIELDS:
+        if stop_field == field_name:
+            continue
+        spans = stop_index[stop_field]
+        span = next((span for span in spans if span[0] >= line_start), None)
+        if span and span[1] <= line_end:
+            found_line = found_line[:span[0] - line_start].strip()
+            break
     
     if field_name == "Цвет":
-        color_match = re.match(r"(\w+)", found_line)
+        color_match = COLOR_RE.match(found_line)
         if color_match:
             return color_match.group(1)
     
     elif field_name == "Год":
-        year_match = re.search(r"(\d{4})", found_line)
+        year_match = YEAR_RE.search(found_line)
         if year_match:
             return year_match.group(1)
     
     elif field_name == "Пробег":
-        mileage_match = re.search(r"(\d+\s*км)", found_line)
+        mileage_match = MILEAGE_RE.search(found_line)
         if mileage_match:
             return mileage_match.group(1)
     
@@ -455,17 +611,17 @@ def extract_field_value(text, field_name):
             return "Гибрид"
     
     elif field_name == "Мощность":
-        power_match = re.search(r"(\d+\s*л\.с\.)", found_line)
+        power_match = POWER_RE.search(found_line)
         if power_match:
             return power_match.group(1)
     
     elif field_name == "Объем":
-        volume_match = re.search(r"(\d+\s*см3|\d+[\.,]\d*\s*L)", found_line)
+        volume_match = VOLUME_RE.search(found_line)
         if volume_match:
             return volume_match.group(1)
     
     elif field_name == "Цена в Китае":
-        price_match = re.search(r"(\d+[\s\d,]*\s*¥)", found_line)
+        price_match = CHINA_PRICE_RE.search(found_line)
         if price_match:
             return price_match.group(1)
     
@@ -473,30 +629,26 @@ def extract_field_value(text, field_name):
         auction_parts = found_line.split("Номер лота")
         if auction_parts:
             result = auction_parts[0].strip()
-            result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+            result = EDGE_SEPARATORS_RE.sub('', result)
             return result if result else "Не найдено"
     
     elif field_name == "Стандарты защиты окружающей среды":
-        euro_match = re.search(r"(Euro\s*[IVX\d\s]+)", found_line, re.IGNORECASE)
+        euro_match = EURO_RE.search(found_line)
         if euro_match:
             euro_standard = euro_match.group(1).strip()
-            euro_standard = re.sub(r'\s+', ' ', euro_standard)
+            euro_standard = WHITESPACE_RE.sub(' ', euro_standard)
             return euro_standard
         return "Не найдено"
     
     elif field_name == "Количество передач":
-        gear_match = re.search(r"(\d+)", found_line)
+        gear_match = GEAR_RE.search(found_line)
         if gear_match:
             return gear_match.group(1)
         return "Не найдено"
     
     elif field_name == "Кузов тип":
-        body_patterns = [
-            r"седан", r"хэтчбек", r"универсал", r"внедорожник", r"кроссовер", 
-            r"купе", r"кабриолет", r"минивэн", r"пикап", r"лифтбек", r"mpv"
-        ]
-        for pattern in body_patterns:
-            body_match = re.search(pattern, found_line, re.IGNORECASE)
+        for body_re in BODY_RES:
+            body_match = body_re.search(found_line)
             if body_match:
                 return body_match.group(0).lower()
         
@@ -507,40 +659,29 @@ def extract_field_value(text, field_name):
             return "Не найдено"
     
     elif field_name == "Модель двигателя":
-        displacement_match = re.search(r"(.+?)(?:Смещение|$)", found_line, re.IGNORECASE)
+        displacement_match = ENGINE_MODEL_RE.search(found_line)
         if displacement_match:
             result = displacement_match.group(1).strip()
-            result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+            result = EDGE_SEPARATORS_RE.sub('', result)
             result = result.replace(',', ' ')
             return result if result and result != '-' else "Не найдено"
         else:
-            result = re.sub(r'^[::\s]+|[::\s]+$', '', found_line)
+            result = EDGE_SEPARATORS_RE.sub('', found_line)
             result = result.replace(',', ' ')
             return result if result and result != '-' else "Не найдено"
 
     result = found_line[:50] if len(found_line) > 50 else found_line
-    result = re.sub(r'^[::\s]+|[::\s]+$', '', result)
+    result = EDGE_SEPARATORS_RE.sub('', result)
     return result if result else "Не найдено"
 
+def extract_fields(text, fields):
+    """Извлекает набор полей из одного текста, индексируя метки один раз"""
+    stop_index = index_stop_fields(text) if text else None
+    return {key: extract_field_value(text, field_name, stop_index) for key, field_name in fields.items()}
+
 def parse_car_info(brief_info, detailed_specs):
-    info = {}
-    
-    info["year"] = extract_field_value(brief_info, "Год")
-    info["mileage"] = extract_field_value(brief_info, "Пробег")
-    info["transmission"] = extract_field_value(brief_info, "КПП")
-    info["color"] = extract_field_value(brief_info, "Цвет")
-    info["drive_type"] = extract_field_value(brief_info, "Привод")
-    info["fuel_type"] = extract_field_value(brief_info, "Тип топлива")
-    info["power"] = extract_field_value(brief_info, "Мощность")
-    info["auction"] = extract_field_value(brief_info, "Аукцион")
-    info["china_price"] = extract_field_value(brief_info, "Цена в Китае")
-    info["engine_volume"] = extract_field_value(brief_info, "Объем")
-    
-    info["body_type"] = extract_field_value(detailed_specs, "Кузов тип")
-    info["environmental_standards"] = extract_field_value(detailed_specs, "Стандарты защиты окружающей среды")
-    info["engine"] = extract_field_value(detailed_specs, "Модель двигателя")
-    info["gear_count"] = extract_field_value(detailed_specs, "Количество передач")
-    
+    info = extract_fields(brief_info, BRIEF_FIELDS)
+    info.update(extract_fields(detailed_specs, SPECS_FIELDS))
     return info
 
 def clean_car_title(title):
@@ -568,18 +709,27 @@ def clean_car_title(title):
 
 def main():
     cycle_count = 0
+    # Один загрузчик на всё время работы: соединения с сайтом переиспользуются между циклами
+    fetcher = AsyncFetcher()
+    scheduler = PollScheduler()
+    start_exporter()
+    car_store.migrate_csv(CSV_FILE)
+    if car_store.exists() and not url_index.exists():
+        url_index.build_from_store()
     
     while True:
         cycle_count += 1
+        cycle_start = time.monotonic()
         print(f"\n{'='*60}")
         print(f"ЦИКЛ ПАРСИНГА #{cycle_count}")
         print(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*60}")
         
-        # Если файл уже существует, проверяем новые объявления
-        if os.path.exists(CSV_FILE):
+        # Если хранилище уже существует и полный парсинг завершён, проверяем новые объявления
+        new_cars_count = 0
+        if car_store.exists() and load_checkpoint() is None:
             print("Проверяем новые объявления...")
-            new_cars = check_for_new_cars()
+            new_cars, listed_count = check_for_new_cars(fetcher)
             
             # Определяем все поля
             all_fields = set()
@@ -587,14 +737,8 @@ def main():
                 for car in new_cars:
                     all_fields.update(car.keys())
             
-            # Читаем существующие поля из основного CSV
-            try:
-                with open(CSV_FILE, "r", newline="", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    if reader.fieldnames:
-                        all_fields.update(reader.fieldnames)
-            except:
-                pass
+            # Существующие поля берём из манифеста хранилища
+            all_fields.update(car_store.get_fieldnames())
             
             fieldnames = sorted(all_fields) if all_fields else []
             
@@ -602,42 +746,44 @@ def main():
                 print(f"Найдено {len(new_cars)} новых объявлений!")
                 # Сохраняем новые машины в отдельный файл
                 save_new_cars_to_file(fieldnames, new_cars)
-                # Добавляем новые машины в начало основного CSV файла
-                prepend_new_cars_to_main_csv(fieldnames, new_cars)
-                print(f"Новые объявления сохранены в файл {NEW_CARS_FILE} и добавлены в начало {CSV_FILE}!")
+                # Добавляем новые машины в начало хранилища
+                with metrics.timer("store_write"):
+                    car_store.prepend_rows(fieldnames, new_cars)
+                url_index.add_urls(car["url"] for car in new_cars)
+                new_cars_count = len(new_cars)
+                print(f"Новые объявления сохранены в файл {NEW_CARS_FILE} и добавлены в начало {car_store.STORE_DIR}!")
             else:
                 print("Новых объявлений не найдено.")
                 # Создаем пустой файл с заголовками
                 save_new_cars_to_file(fieldnames, [])
                 print(f"Файл {NEW_CARS_FILE} обновлен (пустой).")
+            # Повторы из очереди ошибок — не новые объявления: иначе всплеск сбоев загрузки
+            # сокращал бы интервал опроса
+            interval = scheduler.record_poll(listed_count, cycle_start)
         else:
             print("Первый запуск - начинаем полный парсинг...")
             
-            new_cars_buffer, seen_fields = parse_all_pages()
-            print(f"Первый парсинг завершён.")
-            
-            # Создаем пустой файл для новых машин
-            fieldnames = sorted(seen_fields) if seen_fields else []
-            save_new_cars_to_file(fieldnames, [])
+            written_rows = parse_all_pages(fetcher)
+            if load_checkpoint() is None:
+                print(f"Первый парсинг завершён: записано {written_rows} машин.")
+                
+                # Создаем пустой файл для новых машин (сигнал main.py для первого импорта)
+                fieldnames = CAR_FIELDNAMES if written_rows else []
+                save_new_cars_to_file(fieldnames, [])
+            interval = scheduler.next_interval()
 
         print(f"\nЦикл #{cycle_count} завершён.")
         
         # Показываем статистику файлов
-        if os.path.exists(CSV_FILE):
-            with open(CSV_FILE, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                total_cars = sum(1 for row in reader)
-            print(f"Основной файл {CSV_FILE}: {total_cars} записей")
+        if car_store.exists():
+            print(f"Хранилище {car_store.STORE_DIR}: {car_store.total_rows()} записей")
         
-        if os.path.exists(NEW_CARS_FILE):
-            with open(NEW_CARS_FILE, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                new_cars_count = sum(1 for row in reader)
-            print(f"Файл новых машин {NEW_CARS_FILE}: {new_cars_count} записей")
+        print(f"Файл новых машин {NEW_CARS_FILE}: {new_cars_count} записей")
         
-        # Ждём 30 минут перед следующей проверкой
-        print("Ожидание 30 минут до следующей проверки...")
-        time.sleep(1800)  # 30 минут
+        # Интервал считается от начала цикла и подстраивается под частоту новых объявлений
+        delay = max(0.0, interval - (time.monotonic() - cycle_start))
+        print(f"Ожидание {delay / 60:.1f} мин до следующей проверки...")
+        time.sleep(delay)
 
 
 if __name__ == "__main__":
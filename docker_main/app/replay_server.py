@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import random
+from urllib.parse import urlsplit
+from aiohttp import web
+
+# Локальный сервер, отдающий записанные страницы сайта, для воспроизводимых бенчмарков парсера.
+# Структура корпуса:
+#   <corpus>/listing/<N>.html — страницы списка ?PAGE=N
+#   <corpus>/cars/<путь>.html — страницы машин, "/" в пути заменён на "__"
+EMPTY_LISTING = "<html><body><div class=\"statistic\"></div></body></html>"
+
+def car_file_name(path):
+    return path.strip("/").replace("/", "__") + ".html"
+
+def listing_path(corpus_dir, page_num):
+    return os.path.join(corpus_dir, "listing", f"{page_num}.html")
+
+def car_path(corpus_dir, path):
+    return os.path.join(corpus_dir, "cars", car_file_name(path))
+
+def read_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def make_app(corpus_dir, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503, seed=None):
+    """Приложение aiohttp с задержкой ответа и случайными ошибками"""
+    rng = random.Random(seed)
+
+    async def handle(request):
+        delay = max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and rng.random() < error_rate:
+            return web.Response(status=error_status, text="Injected error")
+
+        if request.path.rstrip("/") == "/statistic-china" and "PAGE" in request.query:
+            path = listing_path(corpus_dir, int(request.query["PAGE"]))
+            # За пределами корпуса — пустая страница, как в конце списка на сайте
+            html = read_file(path) if os.path.exists(path) else EMPTY_LISTING
+            return web.Response(text=html, content_type="text/html")
+
+        path = car_path(corpus_dir, request.path)
+        if not os.path.exists(path):
+            return web.Response(status=404, text="Not found")
+        return web.Response(text=read_file(path), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    return app
+
+def record(corpus_dir, pages):
+    """Сохраняет первые pages страниц списка и все их страницы машин с SITE_URL"""
+    from fetcher import AsyncFetcher
+    import parser as car_parser
+
+    os.makedirs(os.path.join(corpus_dir, "listing"), exist_ok=True)
+    os.makedirs(os.path.join(corpus_dir, "cars"), exist_ok=True)
+    saved = 0
+    with AsyncFetcher() as fetcher:
+        for page_num in range(1, pages + 1):
+            html = fetcher.get_html(car_parser.get_listing_url(page_num))
+            car_links = car_parser.parse_listing_html(html)
+            if not car_links:
+                break
+            with open(listing_path(corpus_dir, page_num), "w", encoding="utf-8") as f:
+                f.write(html)
+            for item in fetcher.get_cars_html(car_links):
+                if item["status"] != "success":
+                    print(f"Ошибка загрузки {item['url']}: {item.get('error')}")
+                    continue
+                with open(car_path(corpus_dir, urlsplit(item["url"]).path), "w", encoding="utf-8") as f:
+                    f.write(item["html"])
+                saved += 1
+            print(f"Страница {page_num}: сохранено {len(car_links)} ссылок")
+    print(f"✅ Корпус записан в {corpus_dir}: {saved} страниц машин")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Запись и воспроизведение страниц сайта")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    record_cmd = commands.add_parser("record", help="записать корпус с сайта (SITE_URL)")
+    record_cmd.add_argument("corpus")
+    record_cmd.add_argument("--pages", type=int, default=5)
+
+    serve_cmd = commands.add_parser("serve", help="отдавать записанный корпус")
+    serve_cmd.add_argument("corpus")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8080)
+    serve_cmd.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа, мс")
+    serve_cmd.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, мс")
+    serve_cmd.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой")
+    serve_cmd.add_argument("--error-status", type=int, default=503)
+    serve_cmd.add_argument("--seed", type=int, default=None)
+
+    args = arg_parser.parse_args()
+    if args.command == "record":
+        record(args.corpus, args.pages)
+    else:
+        print(f"🔁 Корпус {args.corpus}: http://{args.host}:{args.port} (SITE_URL для парсера)")
+        web.run_app(
+            make_app(args.corpus, args.latency, args.jitter, args.error_rate, args.error_status, args.seed),
+            host=args.host, port=args.port, print=None
+        )
+
+if __name__ == "__main__":
+    main()
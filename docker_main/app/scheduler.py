@@ -0,0 +1,52 @@
+import os
+import time
+
+# === Настройки расписания проверки новых объявлений ===
+POLL_INTERVAL_MIN = float(os.getenv("POLL_INTERVAL_MIN", "60"))
+POLL_INTERVAL_MAX = float(os.getenv("POLL_INTERVAL_MAX", "1800"))
+# Интервал до первого замера частоты новых объявлений, с.
+POLL_INTERVAL_START = float(os.getenv("POLL_INTERVAL_START", "300"))
+# Сколько новых объявлений в среднем должно набираться между проверками
+POLL_TARGET_NEW = float(os.getenv("POLL_TARGET_NEW", "5"))
+# Вес последнего замера в скользящей средней частоты
+POLL_SMOOTHING = 0.3
+
+class PollScheduler:
+    """Интервал проверки сайта по наблюдаемой частоте появления новых объявлений.
+
+    Частота (объявлений/с) сглаживается экспоненциальной средней, интервал
+    подбирается так, чтобы между проверками появлялось около target_new
+    объявлений, и ограничивается [min_interval, max_interval]. Пока новых
+    объявлений нет, средняя убывает и интервал плавно растёт до максимума.
+    """
+
+    def __init__(self, min_interval=POLL_INTERVAL_MIN, max_interval=POLL_INTERVAL_MAX,
+                 start_interval=POLL_INTERVAL_START, target_new=POLL_TARGET_NEW, smoothing=POLL_SMOOTHING):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.start_interval = start_interval
+        self.target_new = target_new
+        self.smoothing = smoothing
+        self.rate = None
+        self.last_poll = None
+
+    def record_poll(self, new_count, now=None):
+        """Учитывает результат проверки, начатой в момент now, и возвращает следующий интервал"""
+        now = time.monotonic() if now is None else now
+        if self.last_poll is not None:
+            observed = new_count / max(now - self.last_poll, 1e-9)
+            if self.rate is None:
+                self.rate = observed
+            else:
+                self.rate = self.smoothing * observed + (1 - self.smoothing) * self.rate
+        self.last_poll = now
+        return self.next_interval()
+
+    def next_interval(self):
+        if self.rate is None:
+            interval = self.start_interval
+        elif self.rate <= 0:
+            interval = self.max_interval
+        else:
+            interval = self.target_new / self.rate
+        return min(self.max_interval, max(self.min_interval, interval))
@@ -0,0 +1,96 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Канонические типы очищенных данных — в памяти и в снимке Parquet (snapshot.py строит схему отсюда).
+# Повторяющиеся текстовые колонки — категории, числа — самые узкие типы, вмещающие реальные значения,
+# url — обычная строка
+COLUMNS = [
+    "title", "url", "price_rub", "year", "mileage", "transmission", "color", "drive_type",
+    "fuel_type", "power", "auction", "china_price", "engine_volume", "body_type",
+    "environmental_standards", "engine",
+]
+CATEGORY_COLUMNS = [
+    "title", "transmission", "color", "drive_type", "fuel_type", "auction",
+    "body_type", "environmental_standards", "engine",
+]
+NUMERIC_DTYPES = {
+    "year": "int16",
+    "power": "int16",
+    "engine_volume": "int16",
+    "mileage": "int32",
+    "china_price": "int32",
+    # Цена может быть не распознана, поэтому тип с пропусками
+    "price_rub": "Int32",
+}
+# Словари категорий только дополняются: новые значения получают следующие коды,
+# поэтому коды одного значения совпадают во всех пачках и частях
+CATEGORIES_FILE = os.getenv("SCHEMA_CATEGORIES_FILE", "schema_categories.json")
+
+def load_categories(path=CATEGORIES_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_categories(categories, path=CATEGORIES_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(categories, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def extend_categories(categories, df):
+    """Дописывает в словари новые значения из df; возвращает True, если словари изменились"""
+    changed = False
+    for column in CATEGORY_COLUMNS:
+        if column not in df.columns:
+            continue
+        known = categories.setdefault(column, [])
+        known_set = set(known)
+        new_values = sorted(str(value) for value in df[column].dropna().unique() if str(value) not in known_set)
+        if new_values:
+            known.extend(new_values)
+            changed = True
+    return changed
+
+def update_categories(df, path=CATEGORIES_FILE):
+    """Словари категорий с учётом df, сохранённые на диск (для этапов, которые пишут данные)"""
+    categories = load_categories(path)
+    if extend_categories(categories, df):
+        save_categories(categories, path)
+    return categories
+
+def downcast(values, dtype):
+    dtype = pd.api.types.pandas_dtype(dtype)
+    info = np.iinfo(dtype.numpy_dtype if hasattr(dtype, "numpy_dtype") else dtype)
+    present = values.dropna()
+    if len(present) and (present.min() < info.min or present.max() > info.max):
+        raise ValueError(f"{values.name}: значения вне диапазона {dtype}")
+    return values.astype(dtype)
+
+def apply_schema(df, categories=None):
+    """Приводит колонки df к каноническим типам.
+
+    Без categories берутся сохранённые словари; значения, которых в них нет,
+    добавляются в конец только в памяти.
+    """
+    if categories is None:
+        categories = load_categories()
+        extend_categories(categories, df)
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.Categorical(df[column].astype(object), categories=categories.get(column, []))
+    for column, dtype in NUMERIC_DTYPES.items():
+        if column in df.columns:
+            df[column] = downcast(pd.to_numeric(df[column]), dtype)
+    return df
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+def report_memory(before, after, label="Данные"):
+    before_mb, after_mb = memory_mb(before), memory_mb(after)
+    ratio = before_mb / after_mb if after_mb else 0.0
+    print(f"🗜️ {label}: {before_mb:.1f} МБ → {after_mb:.1f} МБ в памяти (x{ratio:.1f})")
@@ -0,0 +1,57 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from schema import COLUMNS, CATEGORY_COLUMNS, NUMERIC_DTYPES
+
+def arrow_type(column):
+    """Тип Arrow для колонки по schema.py: категории — словарные строки, числа — те же ширины"""
+    if column in CATEGORY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if column in NUMERIC_DTYPES:
+        dtype = pd.api.types.pandas_dtype(NUMERIC_DTYPES[column])
+        # У Int32 и подобных nullable-типов numpy-тип хранится отдельно, пропуски Arrow хранит сам
+        return pa.from_numpy_dtype(getattr(dtype, "numpy_dtype", dtype))
+    return pa.string()
+
+# Типизированный колоночный снимок очищенных данных (Parquet, zstd).
+# Схема выводится из schema.py: eda.py пишет снимок, остальные этапы читают только нужные колонки
+SNAPSHOT_SCHEMA = pa.schema([(column, arrow_type(column)) for column in COLUMNS])
+SNAPSHOT_COLUMNS = SNAPSHOT_SCHEMA.names
+
+def snapshot_path(csv_file):
+    return os.path.splitext(csv_file)[0] + ".parquet"
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """df уже приведён schema.apply_schema, поэтому типы совпадают без преобразований"""
+    return pa.Table.from_pandas(df[SNAPSHOT_COLUMNS], schema=SNAPSHOT_SCHEMA, preserve_index=False)
+
+def write_snapshot(df: pd.DataFrame, path: str):
+    pq.write_table(to_table(df), path, compression="zstd", use_dictionary=True)
+
+class SnapshotWriter:
+    """Потоковая запись снимка по частям: каждая часть — отдельная группа строк"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+
+    def write(self, df: pd.DataFrame):
+        table = to_table(df)
+        if self._writer is None:
+            # Схема первой части несёт метаданные pandas, как у write_snapshot
+            self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd", use_dictionary=True)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def read_snapshot(path: str, columns=None) -> pd.DataFrame:
+    return pq.read_table(path, columns=columns).to_pandas()
+
+def read_table(path: str, columns=None) -> pd.DataFrame:
+    """Читает снимок .parquet или обычный CSV"""
+    if path.endswith(".parquet"):
+        return read_snapshot(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
@@ -7,6 +7,7 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeybo
 from neo4j import GraphDatabase
 from llama_analyzer import get_liquidity_analysis
 from catboost_model import predict_car_price
+from graph_schema import ensure_graph_schema
 import os
 
 # Проверяем, используется ли Docker (dotenv только для локальной разработки)
@@ -66,6 +67,11 @@ if wait_for_neo4j():
         with driver.session() as session:
             result = session.run("RETURN 'Connection successful' AS status")
             print("✅ Подключение к Neo4j успешно!")
+        # Поиск по c.title и MERGE импорта идут через индексы
+        try:
+            ensure_graph_schema(driver)
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить индексы Neo4j: {e}")
     except Exception as e:
         print(f"❌ Ошибка подключения к Neo4j: {e}")
         driver = None
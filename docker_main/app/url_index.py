@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import time
+import car_store
+
+# Постоянный индекс URL всех когда-либо сохранённых машин (SQLite, первичный ключ по url)
+INDEX_FILE = os.getenv("URL_INDEX_FILE", "url_index.sqlite")
+
+def connect(index_file=INDEX_FILE):
+    conn = sqlite3.connect(index_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, added_at REAL NOT NULL) WITHOUT ROWID")
+    return conn
+
+def exists(index_file=INDEX_FILE):
+    return os.path.exists(index_file)
+
+def count(index_file=INDEX_FILE):
+    with connect(index_file) as conn:
+        return conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+def add_urls(urls, index_file=INDEX_FILE):
+    """Добавляет URL в индекс; уже известные пропускаются"""
+    now = time.time()
+    conn = connect(index_file)
+    try:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO urls (url, added_at) VALUES (?, ?)", ((url, now) for url in urls))
+    finally:
+        conn.close()
+
+def filter_unseen(urls, index_file=INDEX_FILE):
+    """Возвращает множество URL из urls, которых ещё нет в индексе"""
+    urls = list(urls)
+    if not urls:
+        return set()
+    known = set()
+    conn = connect(index_file)
+    try:
+        # SQLite ограничивает число параметров в запросе
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            known.update(row[0] for row in conn.execute(f"SELECT url FROM urls WHERE url IN ({placeholders})", chunk))
+    finally:
+        conn.close()
+    return set(urls) - known
+
+def build_from_store(index_file=INDEX_FILE, store_dir=car_store.STORE_DIR):
+    """Заполняет индекс всеми URL из хранилища машин (один проход при первом запуске)"""
+    if not car_store.exists(store_dir):
+        return 0
+    batch = []
+    total = 0
+    for row in car_store.iter_rows(store_dir):
+        if row.get("url"):
+            batch.append(row["url"])
+        if len(batch) >= 10000:
+            add_urls(batch, index_file)
+            total += len(batch)
+            batch = []
+    add_urls(batch, index_file)
+    total += len(batch)
+    print(f"🔎 Индекс URL построен по хранилищу: {total} записей")
+    return total